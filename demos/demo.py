@@ -1,5 +1,4 @@
 import socket
-import json
 import time
 import sys
 import os
@@ -10,6 +9,8 @@ root_dir = os.path.dirname(current_dir)  # Get project root directory
 if root_dir not in sys.path:
     sys.path.append(root_dir)  # Add project root directory to Python path
 
+from src.protocol import send_msg, recv_msg
+
 # Configuration 
 COORDINATOR_HOST = "localhost"  # Use localhost for local running
 COORDINATOR_PORT = 5010
@@ -46,8 +47,10 @@ class DemoScenarios:
                 with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
                     s.settimeout(10)  # Increase timeout to 10 seconds
                     s.connect((self.host, self.port))
-                    s.send(json.dumps(request).encode('utf-8'))
-                    response = json.loads(s.recv(4096).decode('utf-8'))
+                    send_msg(s, request)
+                    response = recv_msg(s)
+                    if response is None:
+                        raise ConnectionError("Coordinator closed the connection without replying")
                     return response
             except Exception as e:
                 last_error = e
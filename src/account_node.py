@@ -1,9 +1,15 @@
 import socket
-import json
 import threading
 import time
 import os
 import uuid
+import sys
+import signal
+from pathlib import Path
+
+# Add project root directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+from src.protocol import send_msg, recv_msg, dumps, loads
 
 class AccountNode:
     def __init__(self, node_id, port, coordinator_port=5010, role='primary', coordinator_host='localhost'):
@@ -60,8 +66,8 @@ class AccountNode:
         """
         if os.path.exists(self.data_file):
             try:
-                with open(self.data_file, 'r') as f:
-                    data = json.load(f)
+                with open(self.data_file, 'rb') as f:
+                    data = loads(f.read())
                     self.balance = data.get('balance', 0)
                     self.transaction_history = data.get('transaction_history', [])
             except Exception as e:
@@ -76,8 +82,8 @@ class AccountNode:
             'balance': self.balance,
             'transaction_history': self.transaction_history
         }
-        with open(self.data_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        with open(self.data_file, 'wb') as f:
+            f.write(dumps(data, pretty=True))
     
     def start_server(self):
         """
@@ -98,206 +104,219 @@ class AccountNode:
     def handle_request(self, client):
         """
         Handle incoming client requests.
-        Parses the JSON request and executes the appropriate command.
+        Reads length-prefixed JSON requests until the peer closes the connection,
+        so the coordinator can reuse one connection for many requests.
         
         Args:
             client: Socket connection to the client
         """
         try:
-            data = client.recv(4096)
-            if not data:
-                return
-            
-            request = json.loads(data.decode('utf-8'))
-            command = request.get('command')
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            while True:
+                request = recv_msg(client)
+                if request is None:
+                    return
+                send_msg(client, self.process_request(request))
+        
+        except Exception as e:
+            print(f"Error handling request: {e}")
+        finally:
+            client.close()
+    
+    def process_request(self, request):
+        """
+        Execute a single request and build its response.
+        
+        Args:
+            request: Decoded request dict
             
-            response = {'status': 'error', 'message': 'Unknown command'}
+        Returns:
+            Response dict to send back to the caller
+        """
+        command = request.get('command')
+        
+        response = {'status': 'error', 'message': 'Unknown command'}
+        
+        if command == 'get_balance':
+            with self.lock:
+                response = {
+                    'status': 'success', 
+                    'balance': self.balance,
+                    'role': self.role
+                }
+        
+        elif command == 'prepare_transfer':
+            # Phase 1 of 2PC (Two-Phase Commit)
+            amount = request.get('amount', 0)
+            is_sender = request.get('is_sender', False)
             
-            if command == 'get_balance':
-                with self.lock:
+            with self.lock:
+                if is_sender and self.balance < amount:
                     response = {
-                        'status': 'success', 
-                        'balance': self.balance,
-                        'role': self.role
+                        'status': 'error',
+                        'message': 'Insufficient funds'
                     }
-            
-            elif command == 'prepare_transfer':
-                # Phase 1 of 2PC (Two-Phase Commit)
-                amount = request.get('amount', 0)
-                is_sender = request.get('is_sender', False)
-                
-                with self.lock:
-                    if is_sender and self.balance < amount:
-                        response = {
-                            'status': 'error',
-                            'message': 'Insufficient funds'
-                        }
-                    else:
-                        response = {
-                            'status': 'success',
-                            'message': 'Ready to transfer'
-                        }
-            
-            elif command == 'execute_transfer':
-                # Phase 2 of 2PC (Two-Phase Commit)
-                transaction_id = request.get('transaction_id')
-                amount = request.get('amount', 0)
-                is_sender = request.get('is_sender', False)
-                
-                with self.lock:
-                    # Only execute the actual transfer when the node is primary
-                    if self.role == 'primary':
-                        if is_sender:
-                            self.balance -= amount
-                        else:
-                            self.balance += amount
-                        
-                        # Record transaction
-                        self.transaction_history.append({
-                            'transaction_id': transaction_id,
-                            'amount': amount if not is_sender else -amount,
-                            'timestamp': time.time()
-                        })
-                        
-                        # Save data
-                        self.save_data()
-                        
-                        # Sync with backup
-                        if self.backup_node:
-                            self.sync_to_backup()
-                    # If this is a backup node, record the transaction but don't modify the balance (will be synced from primary)
-                    elif self.role == 'backup':
-                        # Only record transaction history
-                        self.transaction_history.append({
-                            'transaction_id': transaction_id,
-                            'amount': amount if not is_sender else -amount,
-                            'timestamp': time.time(),
-                            'note': 'recorded_at_backup'
-                        })
-                        self.save_data()
-                    
+                else:
                     response = {
                         'status': 'success',
-                        'message': 'Transfer executed',
-                        'new_balance': self.balance,
-                        'role': self.role
+                        'message': 'Ready to transfer'
                     }
+        
+        elif command == 'execute_transfer':
+            # Phase 2 of 2PC (Two-Phase Commit)
+            transaction_id = request.get('transaction_id')
+            amount = request.get('amount', 0)
+            is_sender = request.get('is_sender', False)
             
-            elif command == 'heartbeat':
+            with self.lock:
+                # Only execute the actual transfer when the node is primary
+                if self.role == 'primary':
+                    if is_sender:
+                        self.balance -= amount
+                    else:
+                        self.balance += amount
+                    
+                    # Record transaction
+                    self.transaction_history.append({
+                        'transaction_id': transaction_id,
+                        'amount': amount if not is_sender else -amount,
+                        'timestamp': time.time()
+                    })
+                    
+                    # Save data
+                    self.save_data()
+                    
+                    # Sync with backup
+                    if self.backup_node:
+                        self.sync_to_backup()
+                # If this is a backup node, record the transaction but don't modify the balance (will be synced from primary)
+                elif self.role == 'backup':
+                    # Only record transaction history
+                    self.transaction_history.append({
+                        'transaction_id': transaction_id,
+                        'amount': amount if not is_sender else -amount,
+                        'timestamp': time.time(),
+                        'note': 'recorded_at_backup'
+                    })
+                    self.save_data()
+                
                 response = {
                     'status': 'success',
-                    'node_id': self.node_id,
+                    'message': 'Transfer executed',
+                    'new_balance': self.balance,
                     'role': self.role
                 }
-            
-            elif command == 'init_balance':
-                amount = request.get('amount', 0)
+        
+        elif command == 'heartbeat':
+            response = {
+                'status': 'success',
+                'node_id': self.node_id,
+                'role': self.role
+            }
+        
+        elif command == 'init_balance':
+            amount = request.get('amount', 0)
+            with self.lock:
+                self.balance = amount
+                self.save_data()
+                
+                # If this is a primary node, sync with backup
+                if self.role == 'primary' and self.backup_node:
+                    self.sync_to_backup()
+                
+                response = {
+                    'status': 'success',
+                    'message': f'Balance initialized to {amount}',
+                    'balance': self.balance
+                }
+        
+        elif command == 'sync_data':
+            # Handle sync request from primary
+            if self.role == 'backup':
+                primary_balance = request.get('balance')
+                primary_history = request.get('transaction_history')
+                
                 with self.lock:
-                    self.balance = amount
+                    self.balance = primary_balance
+                    self.transaction_history = primary_history
+                    self.save_data()
+                    self.last_sync_time = time.time()
+                
+                response = {
+                    'status': 'success',
+                    'message': 'Data synchronized with primary',
+                    'sync_time': self.last_sync_time
+                }
+            else:
+                response = {
+                    'status': 'error',
+                    'message': 'Only backup nodes can receive sync data'
+                }
+        
+        elif command == 'become_primary':
+            # Promotion request from coordinator when primary fails
+            if self.role == 'backup':
+                self.role = 'primary'
+                print(f"Node {self.node_id} promoted from backup to primary!")
+                response = {
+                    'status': 'success',
+                    'message': f'Node {self.node_id} promoted to primary',
+                    'new_role': 'primary'
+                }
+            else:
+                response = {
+                    'status': 'error',
+                    'message': 'Only backup nodes can be promoted to primary'
+                }
+        
+        elif command == 'become_backup':
+            # Demotion request from coordinator during primary recovery
+            if self.role == 'primary':
+                self.role = 'backup'
+                print(f"Node {self.node_id} demoted from primary to backup.")
+                # Clear primary node info (as we are now backup)
+                self.primary_node = None 
+                # We might receive primary info via heartbeat later
+                response = {
+                    'status': 'success',
+                    'message': f'Node {self.node_id} demoted to backup',
+                    'new_role': 'backup'
+                }
+            else:
+                # Node is already backup or in an unexpected state
+                print(f"Node {self.node_id} received become_backup command but was already {self.role}. Ignoring.")
+                response = {
+                    'status': 'success', # Still success, as the desired state is achieved
+                    'message': f'Node {self.node_id} is already in backup role'
+                }
+        
+        elif command == 'force_set_balance':
+            # Command from coordinator during recovery to sync state
+            new_balance = request.get('balance')
+            if new_balance is not None:
+                with self.lock:
+                    print(f"Node {self.node_id}: Received force_set_balance. Old balance: {self.balance}, New balance: {new_balance}")
+                    self.balance = new_balance
+                    # Optionally add a history record
+                    self.transaction_history.append({
+                        'transaction_id': str(uuid.uuid4()),
+                        'type': 'force_set_balance',
+                        'balance_after': self.balance,
+                        'timestamp': time.time()
+                    })
                     self.save_data()
-                    
-                    # If this is a primary node, sync with backup
-                    if self.role == 'primary' and self.backup_node:
-                        self.sync_to_backup()
-                    
-                    response = {
-                        'status': 'success',
-                        'message': f'Balance initialized to {amount}',
-                        'balance': self.balance
-                    }
-            
-            elif command == 'sync_data':
-                # Handle sync request from primary
-                if self.role == 'backup':
-                    primary_balance = request.get('balance')
-                    primary_history = request.get('transaction_history')
-                    
-                    with self.lock:
-                        self.balance = primary_balance
-                        self.transaction_history = primary_history
-                        self.save_data()
-                        self.last_sync_time = time.time()
-                    
-                    response = {
-                        'status': 'success',
-                        'message': 'Data synchronized with primary',
-                        'sync_time': self.last_sync_time
-                    }
-                else:
-                    response = {
-                        'status': 'error',
-                        'message': 'Only backup nodes can receive sync data'
-                    }
-            
-            elif command == 'become_primary':
-                # Promotion request from coordinator when primary fails
-                if self.role == 'backup':
-                    self.role = 'primary'
-                    print(f"Node {self.node_id} promoted from backup to primary!")
-                    response = {
-                        'status': 'success',
-                        'message': f'Node {self.node_id} promoted to primary',
-                        'new_role': 'primary'
-                    }
-                else:
-                    response = {
-                        'status': 'error',
-                        'message': 'Only backup nodes can be promoted to primary'
-                    }
-            
-            elif command == 'become_backup':
-                # Demotion request from coordinator during primary recovery
-                if self.role == 'primary':
-                    self.role = 'backup'
-                    print(f"Node {self.node_id} demoted from primary to backup.")
-                    # Clear primary node info (as we are now backup)
-                    self.primary_node = None 
-                    # We might receive primary info via heartbeat later
                     response = {
                         'status': 'success',
-                        'message': f'Node {self.node_id} demoted to backup',
-                        'new_role': 'backup'
-                    }
-                else:
-                    # Node is already backup or in an unexpected state
-                    print(f"Node {self.node_id} received become_backup command but was already {self.role}. Ignoring.")
-                    response = {
-                        'status': 'success', # Still success, as the desired state is achieved
-                        'message': f'Node {self.node_id} is already in backup role'
+                        'message': 'Balance force set successfully',
+                        'new_balance': self.balance
                     }
-            
-            elif command == 'force_set_balance':
-                # Command from coordinator during recovery to sync state
-                new_balance = request.get('balance')
-                if new_balance is not None:
-                    with self.lock:
-                        print(f"Node {self.node_id}: Received force_set_balance. Old balance: {self.balance}, New balance: {new_balance}")
-                        self.balance = new_balance
-                        # Optionally add a history record
-                        self.transaction_history.append({
-                            'transaction_id': str(uuid.uuid4()),
-                            'type': 'force_set_balance',
-                            'balance_after': self.balance,
-                            'timestamp': time.time()
-                        })
-                        self.save_data()
-                        response = {
-                            'status': 'success',
-                            'message': 'Balance force set successfully',
-                            'new_balance': self.balance
-                        }
-                else:
-                    response = {
-                        'status': 'error',
-                        'message': 'Missing balance value for force_set_balance'
-                    }
-            
-            client.send(json.dumps(response).encode('utf-8'))
+            else:
+                response = {
+                    'status': 'error',
+                    'message': 'Missing balance value for force_set_balance'
+                }
         
-        except Exception as e:
-            print(f"Error handling request: {e}")
-        finally:
-            client.close()
+        return response
     
     def send_heartbeat(self):
         """
@@ -318,8 +337,10 @@ class AccountNode:
                         'primary_node': self.primary_node,
                         'client_addr': socket.gethostbyname(socket.gethostname())  # Send local IP address
                     }
-                    s.send(json.dumps(heartbeat).encode('utf-8'))
-                    response = json.loads(s.recv(4096).decode('utf-8'))
+                    send_msg(s, heartbeat)
+                    response = recv_msg(s)
+                    if response is None:
+                        raise ConnectionError("Coordinator closed the connection without replying")
                     
                     # Check if coordinator assigned a backup for this node (if primary)
                     if self.role == 'primary' and response.get('status') == 'success':
@@ -375,8 +396,10 @@ class AccountNode:
                     'balance': self.balance,
                     'transaction_history': self.transaction_history
                 }
-                s.send(json.dumps(sync_data).encode('utf-8'))
-                response = json.loads(s.recv(4096).decode('utf-8'))
+                send_msg(s, sync_data)
+                response = recv_msg(s)
+                if response is None:
+                    raise ConnectionError("Backup closed the connection without replying")
                 
                 if response.get('status') == 'success':
                     print(f"Synchronized data with backup node {self.backup_node['node_id']}")
@@ -412,11 +435,10 @@ class AccountNode:
                     health_check = {
                         'command': 'heartbeat'
                     }
-                    s.send(json.dumps(health_check).encode('utf-8'))
-                    response_data = s.recv(4096)
-                    if not response_data: # Handle empty response as potential issue
+                    send_msg(s, health_check)
+                    response = recv_msg(s)
+                    if response is None: # Handle empty response as potential issue
                         raise socket.error("Empty response received from primary")
-                    response = json.loads(response_data.decode('utf-8'))
                     
                     if response.get('status') == 'success':
                         # Primary is alive, exit the check successfully
@@ -453,7 +475,7 @@ class AccountNode:
                     'failed_node': self.primary_node['node_id'],
                     'reporter_role': 'backup'
                 }
-                s.send(json.dumps(failure_report).encode('utf-8'))
+                send_msg(s, failure_report)
                 # No need to wait for response
                 print(f"Reported primary {self.primary_node['node_id']} failure to coordinator")
         
@@ -465,8 +487,6 @@ if __name__ == "__main__":
     Main entry point for running an account node.
     Parses command line arguments and starts the node.
     """
-    import sys
-    
     if len(sys.argv) < 3:
         print("Usage: python account_node.py <node_id> <port> [coordinator_port] [role] [coordinator_host]")
         sys.exit(1)
@@ -479,8 +499,9 @@ if __name__ == "__main__":
     coordinator_host = sys.argv[5] if len(sys.argv) > 5 else 'localhost'
     node = AccountNode(node_id, port, coordinator_port, role, coordinator_host)
     
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print(f"Account Node {node_id} shutting down...")
+    # Block until SIGINT/SIGTERM instead of waking every second to poll for KeyboardInterrupt
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    stop.wait()
+    print(f"Account Node {node_id} shutting down...")
@@ -1,9 +1,9 @@
 import socket
-import json
 import sys
 import os
 sys.path.append('.')
 from config.network_config import COMPUTER_A_IP, COORDINATOR_PORT
+from src.protocol import send_msg, recv_msg
 
 class BankClient:
     def __init__(self, coordinator_host=COMPUTER_A_IP, coordinator_port=COORDINATOR_PORT):
@@ -17,9 +17,11 @@ class BankClient:
                 s.settimeout(5)  # Set timeout to 5 seconds
                 s.connect((self.coordinator_host, self.coordinator_port))
                 print("Connection established, sending request...")
-                s.send(json.dumps(request).encode('utf-8'))
+                send_msg(s, request)
                 print("Request sent, waiting for response...")
-                response = json.loads(s.recv(4096).decode('utf-8'))
+                response = recv_msg(s)
+                if response is None:
+                    raise ConnectionError("Coordinator closed the connection without replying")
                 print("Response received.")
                 return response
         except socket.timeout:
@@ -0,0 +1,150 @@
+import struct
+import threading
+
+import orjson
+
+# Every message is a JSON document prefixed with its length as a 4-byte
+# big-endian unsigned integer, so one connection can carry several requests
+# and the reader always knows where a message ends. This applies to all
+# traffic: clients and nodes talking to the coordinator, the coordinator
+# talking to nodes, and primaries syncing their backups.
+HEADER = struct.Struct('>I')
+
+# Largest message body accepted. The length comes from the peer, so a bad or
+# hostile header is rejected before anything is allocated for it.
+MAX_FRAME_SIZE = 16 << 20
+
+# Each thread reads messages into its own reusable receive buffer. Decoding
+# copies everything out of it, so the buffer is free again as soon as
+# recv_msg returns. Buffers that had to grow past SCRATCH_MAX_SIZE for an
+# unusually large message are not kept.
+SCRATCH_SIZE = 8192
+SCRATCH_MAX_SIZE = 1 << 20
+_scratch = threading.local()
+
+
+def dumps(obj, pretty=False):
+    """
+    Serialize an object to JSON bytes.
+
+    Args:
+        obj: JSON-serializable object
+        pretty: Indent the output, for files meant to be read by people
+
+    Returns:
+        UTF-8 encoded JSON bytes
+    """
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else None)
+
+
+# Accepts bytes, bytearray, memoryview or str
+loads = orjson.loads
+
+
+def encode_msg(message):
+    """
+    Encode a message as a length-prefixed frame.
+
+    Args:
+        message: Message dict, or already-encoded JSON bytes
+
+    Returns:
+        Bytes ready to be written to the socket
+    """
+    payload = message if isinstance(message, bytes) else dumps(message)
+    return HEADER.pack(len(payload)) + payload
+
+
+def send_msg(sock, message):
+    """
+    Send one message over a socket.
+
+    Args:
+        sock: Connected socket
+        message: Message dict, or already-encoded JSON bytes
+    """
+    sock.sendall(encode_msg(message))
+
+
+def recv_exact(sock, size):
+    """
+    Read exactly size bytes from a socket.
+
+    Args:
+        sock: Connected socket
+        size: Number of bytes to read
+
+    Returns:
+        A bytearray holding the data read, or None if the peer closed the connection before sending anything
+    """
+    buf = bytearray(size)
+    if not recv_into_exact(sock, memoryview(buf)):
+        return None
+    return buf
+
+
+def recv_into_exact(sock, view):
+    """
+    Fill a buffer completely from a socket.
+
+    Args:
+        sock: Connected socket
+        view: Writable memoryview to fill
+
+    Returns:
+        True once the buffer is full, False if the peer closed the connection before sending anything
+    """
+    size = len(view)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            if received == 0:
+                return False
+            raise ConnectionError("Connection closed in the middle of a message")
+        received += count
+    return True
+
+
+def scratch_buffer(size):
+    """
+    Borrow this thread's receive buffer, grown to at least size bytes.
+
+    Args:
+        size: Number of bytes needed
+
+    Returns:
+        A memoryview of exactly size bytes, valid until the thread's next call
+    """
+    buf = getattr(_scratch, 'buf', None)
+    if buf is None or len(buf) < size:
+        buf = bytearray(max(size, SCRATCH_SIZE))
+        if len(buf) <= SCRATCH_MAX_SIZE:
+            _scratch.buf = buf
+    return memoryview(buf)[:size]
+
+
+def recv_msg(sock):
+    """
+    Receive one message from a socket.
+    Empty or oversized frames raise ValueError, like malformed JSON does;
+    the connection is out of step after that and should be closed.
+
+    Args:
+        sock: Connected socket
+
+    Returns:
+        The decoded message dict, or None if the peer closed the connection
+    """
+    header = scratch_buffer(HEADER.size)
+    if not recv_into_exact(sock, header):
+        return None
+    (size,) = HEADER.unpack(header)
+    if not size:
+        raise ValueError("Received an empty message")
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Message of {size} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+    payload = scratch_buffer(size)
+    if not recv_into_exact(sock, payload):
+        raise ConnectionError("Connection closed in the middle of a message")
+    return loads(payload)
@@ -1,15 +1,42 @@
 import socket
-import json
 import threading
 import time
 import uuid
 import os
 import sys
+import queue
+import heapq
+import signal
+import logging
+from collections import deque
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add project root to system path
 sys.path.append(str(Path(__file__).parent.parent))
 from config.network_config import COORDINATOR_PORT
+from src.protocol import send_msg, recv_msg, encode_msg, dumps, loads
+
+log = logging.getLogger("coord")
+
+# Canned responses that never change are encoded and framed once instead of per request
+UNKNOWN_COMMAND_RESPONSE = encode_msg({'status': 'error', 'message': 'Unknown command'})
+SERVER_BUSY_RESPONSE = encode_msg({'status': 'error', 'message': 'Server busy, please retry later'})
+INVALID_REPORT_RESPONSE = encode_msg({'status': 'error', 'message': 'Invalid failure report format'})
+# Replies to the common heartbeats from a known node, live or marked failed; heartbeats
+# that carry pairing info copy the dict template and extend it instead
+HEARTBEAT_ACK = {'status': 'success', 'message': 'Heartbeat received and node info updated'}
+HEARTBEAT_ACK_RESPONSE = encode_msg(HEARTBEAT_ACK)
+HEARTBEAT_FAILED_NODE = {'status': 'success', 'message': 'Heartbeat received from failed node, status unchanged'}
+HEARTBEAT_FAILED_NODE_RESPONSE = encode_msg(HEARTBEAT_FAILED_NODE)
+
+# Node commands that are safe to resend if the connection dies after the request went out
+IDEMPOTENT_COMMANDS = frozenset({'get_balance', 'prepare_transfer', 'heartbeat'})
+
+# Transaction states that need no further attention and may be moved to the archive;
+# 'inconsistent' and 'error' transactions stay in memory for manual recovery
+FINISHED_TX_STATUSES = frozenset({'completed', 'aborted', 'failed'})
 
 class TransactionCoordinator:
     def __init__(self, port=COORDINATOR_PORT, coordinator_id="c1"):
@@ -25,13 +52,76 @@ class TransactionCoordinator:
         self.account_nodes = {}  # {node_id: {'port': port, 'last_heartbeat': timestamp, 'role': role, 'backup': backup_node_id}}
         self.node_hosts = {}  # {node_id: host_ip} - Track the host address for each node
         self.transactions = {}  # {transaction_id: {'status': status, 'from': node_id, 'to': node_id, 'amount': amount}}
-        self.lock = threading.Lock()
+        # Locks are always taken in this order: lock -> tx_lock -> wal_lock
+        self.lock = threading.RLock()  # Guards node state: account_nodes, node_hosts, pairings, heartbeat deadlines
+        self.tx_lock = threading.RLock()  # Guards transactions, so 2PC bookkeeping never waits on heartbeats
+        self.wal_lock = threading.Lock()  # Orders write-ahead log appends with snapshots
+        self.snapshot_lock = threading.Lock()  # One snapshot at a time; taken before any of the above
         self.data_file = "data/coordinator_data.json"
+        self.wal_file = "data/coordinator_wal.log"  # Append-only log of state changes since the last snapshot
+        self.wal_max_bytes = 1 << 20  # Compact the log into a snapshot once it grows past this size...
+        self.snapshot_interval = 30  # ...or at least this often (seconds) while it has records
+        self.min_snapshot_gap = 2.0  # Snapshot requests arriving faster than this are coalesced
+        self.snapshot_requested = threading.Event()  # Set when the log outgrows wal_max_bytes
+        self.wal = None
+        self.archive_file = "data/coordinator_tx_archive.log"  # Finished transactions evicted from memory
+        self.archive = None
+        self.max_finished_transactions = 10000  # Finished transactions kept in memory and in the snapshot
+        self.finished_transactions = deque()  # IDs of finished transactions, oldest first
         self.node_pairs = {}  # {primary_id: backup_id} - tracks primary-backup relationships
+        self.backup_to_primary = {}  # {backup_id: primary_id} - reverse index of node_pairs, kept in step by pair_nodes/unpair_node
+        self.heartbeat_timeout = 60  # Seconds without a heartbeat before a node is marked failed
+        self.heartbeat_deadlines = []  # Heap of (deadline, node_id); stale entries are skipped when popped
+        # {node_id: time.monotonic() of its latest heartbeat}; timeouts are measured on this clock so
+        # wall-clock jumps cannot fail healthy nodes, last_heartbeat stays wall time for display and disk
+        self.heartbeat_seen = {}
+        self.min_monitor_wait = 0.5  # Shortest pause between two timeout checks (seconds)
+        self.monitor_wake = threading.Event()  # Set when the deadline heap goes from empty to non-empty
+        
+        # Bounded worker pool for client connections (replaces one thread per request)
+        self.max_workers = 64
+        self.max_pending_requests = 256  # Requests allowed to wait for a free worker before rejecting
+        self.client_timeout = 10  # Seconds a silent client may hold a pool worker
+        self.request_pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="req")
+        self.request_slots = threading.BoundedSemaphore(self.max_workers + self.max_pending_requests)
+        self.server_socket = None
+        self.stopping = threading.Event()  # Set by shutdown() to stop the accept loop
+        
+        # Persistent connections to account nodes, reused across RPCs
+        self.conn_pool = {}  # {(host, port): LifoQueue of idle sockets}
+        self.conn_pool_lock = threading.Lock()
+        self.max_idle_connections = 8  # Idle sockets kept per node, extra ones are closed
+        self.rpc_timeout = 5  # Seconds to wait for an account node to answer
+        # Separate pool for fanning out independent node RPCs; request workers block on
+        # these futures, so sharing request_pool could starve it
+        self.rpc_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="rpc")
+        # become_primary notifications still in flight, so recovery can wait for them;
+        # guarded by self.lock, entries remove themselves once the notification finishes
+        self.promotion_notices = {}  # {backup_id: Future}
+        
+        # Command dispatch table; every handler takes (request, client) and returns the response
+        self.command_handlers = {
+            'heartbeat': self.handle_heartbeat,
+            'batch_heartbeat': self.handle_batch_heartbeat,
+            'list_accounts': self.handle_list_accounts,
+            'simulate_failure': self.handle_simulate_failure,
+            'recover_node': self.handle_recover_node,
+            'check_node_status': self.handle_check_node_status,
+            'transfer': self.handle_transfer,
+            'get_balance': self.handle_get_balance,
+            'report_node_failure': self.handle_report_node_failure,
+            'init_accounts': self.handle_init_accounts,
+        }
         
         # Load data if exists
         self.load_data()
         
+        # Open the write-ahead log once; state changes are appended to it
+        os.makedirs(os.path.dirname(self.wal_file), exist_ok=True)
+        self.wal = open(self.wal_file, 'ab', buffering=0)
+        self.wal_size = self.wal.tell()
+        self.archive = open(self.archive_file, 'ab', buffering=0)
+        
         # Start server
         self.server_thread = threading.Thread(target=self.start_server)
         self.server_thread.daemon = True
@@ -42,740 +132,1281 @@ class TransactionCoordinator:
         self.monitor_thread.daemon = True
         self.monitor_thread.start()
         
-        print(f"Transaction Coordinator {self.coordinator_id} started on port {self.port}")
-        print(f"Registered account nodes: {list(self.account_nodes.keys())}")
+        # Start snapshot thread that periodically compacts the write-ahead log
+        self.snapshot_thread = threading.Thread(target=self.compact_wal_periodically)
+        self.snapshot_thread.daemon = True
+        self.snapshot_thread.start()
+        
+        log.info("Transaction Coordinator %s started on port %s", self.coordinator_id, self.port)
+        log.info("Registered account nodes: %s", list(self.account_nodes.keys()))
     
     def load_data(self):
         """
         Load coordinator data from persistent storage.
-        Restores account nodes, transactions, and node pairing information.
+        Restores account nodes, transactions, and node pairing information
+        from the last snapshot, then replays the write-ahead log on top of it.
         """
         if os.path.exists(self.data_file):
             try:
-                with open(self.data_file, 'r') as f:
-                    data = json.load(f)
+                with open(self.data_file, 'rb') as f:
+                    data = loads(f.read())
                     self.account_nodes = data.get('account_nodes', {})
                     self.transactions = data.get('transactions', {})
                     self.node_pairs = data.get('node_pairs', {})
                     self.node_hosts = data.get('node_hosts', {})
-                    
-                    # Debug information
-                    print(f"Data loading completed. Node status:")
-                    for node_id, node_info in self.account_nodes.items():
-                        status = node_info.get('status', 'active')
-                        role = node_info.get('role', 'primary')
-                        print(f"  - Node {node_id}: status={status}, role={role}")
             except Exception as e:
-                print(f"Error loading coordinator data: {e}")
+                log.error("Error loading coordinator data: %s", e)
+        
+        self.replay_wal()
+        self.backup_to_primary = {backup_id: primary_id for primary_id, backup_id in self.node_pairs.items()}
+        # Transactions are recorded when they start, so dict order approximates age
+        self.finished_transactions = deque(tx_id for tx_id, record in self.transactions.items()
+                                           if record.get('status') in FINISHED_TX_STATUSES)
+        # Carry each restored node's heartbeat age over to the monotonic clock, but give
+        # every restored node one full timeout from now to heartbeat again
+        now, wall_now = time.monotonic(), time.time()
+        for node_id, node_info in self.account_nodes.items():
+            age = max(0.0, wall_now - (node_info.get('last_heartbeat') or 0))
+            self.heartbeat_seen[node_id] = now - age
+            self.heartbeat_deadlines.append((now + self.heartbeat_timeout, node_id))
+        heapq.heapify(self.heartbeat_deadlines)
+        
+        # Debug information; skip walking every node unless it will be shown
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Data loading completed. Node status:")
+            for node_id, node_info in self.account_nodes.items():
+                status = node_info.get('status', 'active')
+                role = node_info.get('role', 'primary')
+                log.debug("  - Node %s: status=%s, role=%s", node_id, status, role)
+    
+    def replay_wal(self):
+        """
+        Replay state changes logged since the last snapshot.
+        Every record carries the full new value of what it changed, so replay is idempotent.
+        A torn final record is cut off so new appends start on a clean line.
+        """
+        if not os.path.exists(self.wal_file):
+            return
+        
+        replayed = 0
+        good_offset = 0
+        try:
+            with open(self.wal_file, 'r+b') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # A torn final line from a crash mid-write; everything before it is valid
+                        break
+                    try:
+                        entry = loads(line)
+                    except ValueError:
+                        break
+                    self.apply_wal_entry(entry)
+                    replayed += 1
+                    good_offset += len(line)
+                if good_offset < f.seek(0, os.SEEK_END):
+                    log.warning("Discarding torn write-ahead log tail after byte %s", good_offset)
+                    f.truncate(good_offset)
+            if replayed:
+                log.info("Replayed %s write-ahead log records from %s", replayed, self.wal_file)
+        except Exception as e:
+            log.error("Error replaying write-ahead log: %s", e)
+    
+    def apply_wal_entry(self, entry):
+        """
+        Apply a single write-ahead log record to the in-memory state.
+        
+        Args:
+            entry: Decoded log record, see log_transaction/log_node/log_pair
+        """
+        op = entry.get('op')
+        if op == 'txn':
+            self.transactions[entry['transaction_id']] = entry['record']
+        elif op == 'node':
+            self.account_nodes[entry['node_id']] = entry['info']
+            if entry.get('host'):
+                self.node_hosts[entry['node_id']] = entry['host']
+        elif op == 'txn_drop':
+            for transaction_id in entry['transaction_ids']:
+                self.transactions.pop(transaction_id, None)
+        elif op == 'pair':
+            if entry.get('backup_id'):
+                self.node_pairs[entry['primary_id']] = entry['backup_id']
+            else:
+                self.node_pairs.pop(entry['primary_id'], None)
     
     def save_data(self):
         """
         Save coordinator data to persistent storage.
-        Writes account nodes, transactions, and node pairing information to a JSON file.
+        Copies account nodes, transactions, and node pairing information under
+        the locks, then writes the JSON snapshot without holding them, so disk
+        I/O never stalls request handlers. Must be called without any lock held.
         """
-        # Debug information
-        print(f"Saving node status information:")
-        for node_id, node_info in self.account_nodes.items():
-            status = node_info.get('status', 'active')
-            role = node_info.get('role', 'primary')
-            print(f"  - Node {node_id}: status={status}, role={role}")
-            
-        data = {
-            'account_nodes': self.account_nodes,
-            'transactions': self.transactions,
-            'node_pairs': self.node_pairs,
-            'node_hosts': self.node_hosts
-        }
+        with self.snapshot_lock:
+            with self.lock, self.tx_lock, self.wal_lock:
+                data = {
+                    'account_nodes': {node_id: dict(info) for node_id, info in self.account_nodes.items()},
+                    'transactions': {tx_id: dict(record) for tx_id, record in self.transactions.items()},
+                    'node_pairs': dict(self.node_pairs),
+                    'node_hosts': dict(self.node_hosts)
+                }
+                logged = self.wal_size if self.wal is not None else 0
+            self.write_snapshot(data, logged)
+    
+    def write_snapshot(self, data, logged):
+        """
+        Write a snapshot file and drop the write-ahead log records it covers.
+        
+        Args:
+            data: Copy of the coordinator state to write
+            logged: Size of the write-ahead log when the copy was taken
+        """
+        # Debug information; skip walking every node unless it will be shown
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Saving node status information:")
+            for node_id, node_info in data['account_nodes'].items():
+                status = node_info.get('status', 'active')
+                role = node_info.get('role', 'primary')
+                log.debug("  - Node %s: status=%s, role=%s", node_id, status, role)
         
         # Ensure directory exists
         os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
         
         try:
-            with open(self.data_file, 'w') as f:
-                json.dump(data, f, indent=2)
-            print(f"Data has been saved to {self.data_file}")
+            # Write a complete new snapshot next to the old one and swap it in atomically,
+            # so a crash mid-write never leaves a half-written snapshot behind
+            tmp_file = self.data_file + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                f.write(dumps(data, pretty=True))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.data_file)
+            log.debug("Data has been saved to %s", self.data_file)
         except Exception as e:
-            print(f"Error saving data: {e}")
+            log.error("Error saving data: %s", e)
+            return
+        
+        # The snapshot now contains every change logged before the copy was taken
+        with self.wal_lock:
+            self.drop_wal_prefix(logged)
+    
+    def drop_wal_prefix(self, size):
+        """
+        Remove the first size bytes of the write-ahead log, keeping records
+        appended after them. Must be called with self.wal_lock held.
+        
+        Args:
+            size: Number of bytes at the start of the log to drop
+        """
+        if self.wal is None:
+            return
+        if self.wal_size == size:
+            self.wal.truncate(0)
+            self.wal_size = 0
+            return
+        
+        # Records were appended while the snapshot was written; move them into a fresh log
+        with open(self.wal_file, 'rb') as f:
+            f.seek(size)
+            tail = f.read()
+        tmp_file = self.wal_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.wal_file)
+        self.wal.close()
+        self.wal = open(self.wal_file, 'ab', buffering=0)
+        self.wal_size = len(tail)
+    
+    def append_wal(self, entry):
+        """
+        Append one state change record to the write-ahead log. If the log cannot
+        be written, the background thread is asked for a full snapshot instead.
+        
+        Args:
+            entry: JSON-serializable record understood by apply_wal_entry
+        """
+        if self.wal is None:
+            # The log is opened at the end of __init__; until then only a snapshot can persist changes
+            self.snapshot_requested.set()
+            return
+        
+        with self.wal_lock:
+            try:
+                line = dumps(entry) + b'\n'
+                self.wal.write(line)
+                self.wal_size += len(line)
+            except Exception as e:
+                log.error("Error writing write-ahead log, falling back to snapshot: %s", e)
+                self.snapshot_requested.set()
+                return
+        
+        if self.wal_size >= self.wal_max_bytes:
+            # Leave the full snapshot to the background thread instead of stalling this handler
+            self.snapshot_requested.set()
+    
+    def pair_nodes(self, primary_id, backup_id):
+        """
+        Register a primary-backup pair, keeping the reverse index in step.
+        Must be called with self.lock held.
+        
+        Args:
+            primary_id: ID of the primary node
+            backup_id: ID of its backup node
+        """
+        self.node_pairs[primary_id] = backup_id
+        self.backup_to_primary[backup_id] = primary_id
+    
+    def unpair_node(self, primary_id):
+        """
+        Remove the pairing of a primary node, if any. Must be called with self.lock held.
+        
+        Args:
+            primary_id: ID of the primary node
+        """
+        backup_id = self.node_pairs.pop(primary_id, None)
+        if backup_id is not None and self.backup_to_primary.get(backup_id) == primary_id:
+            del self.backup_to_primary[backup_id]
+    
+    def track_heartbeat(self, node_id, seen=None):
+        """
+        Record a node's heartbeat and schedule a timeout check for it.
+        Older entries for the node stay in the heap and are skipped by monitor_nodes.
+        
+        Args:
+            node_id: ID of the account node that sent a heartbeat
+            seen: time.monotonic() of the heartbeat, defaults to now
+        """
+        if seen is None:
+            seen = time.monotonic()
+        self.heartbeat_seen[node_id] = seen
+        was_empty = not self.heartbeat_deadlines
+        heapq.heappush(self.heartbeat_deadlines, (seen + self.heartbeat_timeout, node_id))
+        # Deadlines are heartbeat_timeout after a heartbeat (or after load_data for restored
+        # nodes), so a new one is never earlier than the current head and the monitor
+        # only needs waking when it is idling on an empty heap
+        if was_empty:
+            self.monitor_wake.set()
+    
+    def next_monitor_wait(self):
+        """
+        Time until the earliest heartbeat deadline. Must be called with self.lock held.
+        
+        Returns:
+            Seconds the monitor may wait before the next check
+        """
+        if not self.heartbeat_deadlines:
+            return self.heartbeat_timeout
+        return max(self.min_monitor_wait, self.heartbeat_deadlines[0][0] - time.monotonic())
+    
+    def heartbeat_age(self, node_id):
+        """
+        Seconds since the latest heartbeat of a node, measured on the monotonic clock.
+        
+        Args:
+            node_id: ID of the account node
+            
+        Returns:
+            Age in seconds, infinity if the node never sent a heartbeat
+        """
+        seen = self.heartbeat_seen.get(node_id)
+        return float('inf') if seen is None else time.monotonic() - seen
+    
+    def log_transaction(self, transaction_id):
+        """
+        Log the current record of a transaction after its status changed.
+        Called without tx_lock held; only the thread running the transaction changes its record.
+        
+        Args:
+            transaction_id: ID of the transaction whose status changed
+        """
+        record = self.transactions[transaction_id]
+        self.append_wal({'op': 'txn', 'transaction_id': transaction_id, 'record': record})
+        if record.get('status') in FINISHED_TX_STATUSES:
+            self.retire_transaction(transaction_id)
+    
+    def retire_transaction(self, transaction_id):
+        """
+        Mark a transaction as finished and move the oldest finished transactions
+        to the archive file once more than max_finished_transactions are kept,
+        so memory and snapshot size stay bounded. Called without tx_lock held.
+        
+        Args:
+            transaction_id: ID of the transaction that just finished
+        """
+        dropped = []
+        with self.tx_lock:
+            self.finished_transactions.append(transaction_id)
+            while len(self.finished_transactions) > self.max_finished_transactions:
+                old_id = self.finished_transactions.popleft()
+                record = self.transactions.pop(old_id, None)
+                if record is not None:
+                    dropped.append((old_id, record))
+        if not dropped:
+            return
+        
+        if self.archive is not None:
+            with self.wal_lock:
+                try:
+                    self.archive.write(b''.join(dumps(dict(record, transaction_id=tx_id)) + b'\n'
+                                                for tx_id, record in dropped))
+                except Exception as e:
+                    log.error("Error archiving finished transactions: %s", e)
+        # Keeps replay from bringing the archived transactions back
+        self.append_wal({'op': 'txn_drop', 'transaction_ids': [tx_id for tx_id, _ in dropped]})
+    
+    def log_node(self, node_id):
+        """
+        Log the current record and host of an account node after it changed.
+        
+        Args:
+            node_id: ID of the account node that changed
+        """
+        self.append_wal({'op': 'node', 'node_id': node_id, 'info': self.account_nodes[node_id], 'host': self.node_hosts.get(node_id)})
+    
+    def log_pair(self, primary_id):
+        """
+        Log the current pairing of a primary node (a missing backup means unpaired).
+        
+        Args:
+            primary_id: ID of the primary node whose pairing changed
+        """
+        self.append_wal({'op': 'pair', 'primary_id': primary_id, 'backup_id': self.node_pairs.get(primary_id)})
+    
+    def compact_wal_periodically(self):
+        """
+        Fold the write-ahead log into a fresh snapshot whenever it outgrows
+        wal_max_bytes or could not be written, and at least every
+        snapshot_interval seconds while it has records. Bursts of requests are
+        coalesced into one snapshot per min_snapshot_gap seconds.
+        """
+        while True:
+            requested = self.snapshot_requested.wait(self.snapshot_interval)
+            self.snapshot_requested.clear()
+            if requested or self.wal_size:
+                self.save_data()
+            time.sleep(self.min_snapshot_gap)
     
     def start_server(self):
         """
         Start the TCP server to listen for incoming requests.
-        Creates a new thread for each client connection.
+        Hands each client connection to the bounded request pool; when the pool
+        and its backlog are full the connection is rejected with a busy response.
         """
         server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server.bind(('0.0.0.0', self.port))
         server.listen(5)
+        self.server_socket = server
         
-        while True:
-            client, addr = server.accept()
-            client_thread = threading.Thread(target=self.handle_request, args=(client,))
-            client_thread.daemon = True
-            client_thread.start()
+        while not self.stopping.is_set():
+            try:
+                client, addr = server.accept()
+            except OSError:
+                if self.stopping.is_set():
+                    break  # shutdown() closed the listening socket
+                raise
+            if not self.request_slots.acquire(blocking=False):
+                self.reject_busy(client)
+                continue
+            try:
+                future = self.request_pool.submit(self.handle_request, client)
+            except RuntimeError:
+                # The pool was shut down between accept and submit
+                self.request_slots.release()
+                client.close()
+                break
+            future.add_done_callback(lambda f, client=client: self.release_request_slot(f, client))
+    
+    def release_request_slot(self, future, client):
+        """
+        Free the pool slot held by a finished request. A request cancelled before
+        it ran never reached handle_request, so its client socket is closed here.
+        
+        Args:
+            future: Future of the handle_request call
+            client: Socket connection to the client
+        """
+        if future.cancelled():
+            client.close()
+        self.request_slots.release()
+    
+    def shutdown(self):
+        """
+        Stop accepting connections and handing out request workers. Queued requests
+        are cancelled and running ones are left to finish on their own (bounded by
+        client_timeout).
+        """
+        self.stopping.set()
+        if self.server_socket is not None:
+            try:
+                # Wakes up the blocked accept() before the socket is closed
+                self.server_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.server_socket.close()
+        self.request_pool.shutdown(wait=False, cancel_futures=True)
+        self.rpc_pool.shutdown(wait=False, cancel_futures=True)
+    
+    def reject_busy(self, client):
+        """
+        Reply to a client that cannot be served because the coordinator is overloaded.
+        
+        Args:
+            client: Socket connection to the client
+        """
+        try:
+            client.sendall(self.encode_response(SERVER_BUSY_RESPONSE))
+        except Exception as e:
+            log.error("Error rejecting request: %s", e)
+        finally:
+            client.close()
     
     def handle_request(self, client):
         """
         Handle incoming client requests.
-        Parses the JSON request and executes the appropriate command.
+        Parses the JSON request and dispatches it to the handler for its command.
         
         Args:
             client: Socket connection to the client
         """
         try:
-            data = client.recv(4096)
-            if not data:
+            # Pool workers are shared, so never let one client block a worker forever
+            client.settimeout(self.client_timeout)
+            request = recv_msg(client)
+            if request is None:
                 return
             
-            request = json.loads(data.decode('utf-8'))
-            command = request.get('command')
+            handler = self.command_handlers.get(request.get('command'))
+            response = handler(request, client) if handler else UNKNOWN_COMMAND_RESPONSE
+            client.sendall(self.encode_response(response))
+        
+        except Exception:
+            log.exception("Error handling request")
+        finally:
+            client.close()
+    
+    def handle_batch_heartbeat(self, request, client):
+        """
+        Record several nodes' heartbeats sent in one request, e.g. by a per-host agent.
+        
+        Args:
+            request: Decoded request
+            client: Socket connection to the client
             
-            response = {'status': 'error', 'message': 'Unknown command'}
+        Returns:
+            Response dict
+        """
+        entries = request.get('entries', [])
+        pairings = []
+        with self.lock:  # Taken once for the whole batch; handle_heartbeat re-enters it
+            for entry in entries:
+                entry_response = self.handle_heartbeat(entry, client)
+                if isinstance(entry_response, dict) and (entry_response.get('backup_assigned') or entry_response.get('primary_assigned')):
+                    pairings.append(dict(entry_response, node_id=entry.get('node_id')))
+        response = {
+            'status': 'success',
+            'count': len(entries),
+            'pairings': pairings
+        }
+        
+        return response
+    
+    def handle_list_accounts(self, request, client):
+        """
+        List the IDs of all registered account nodes.
+        
+        Args:
+            request: Decoded request
+            client: Socket connection to the client
             
-            if command == 'heartbeat':
-                # Handle node heartbeat
-                node_id = request.get('node_id')
-                node_type = request.get('node_type')
-                port = request.get('port')
-                role_from_heartbeat = request.get('role', 'primary')  # Get role reported by node
-                backup_node = request.get('backup_node')
-                primary_node = request.get('primary_node')
-                client_addr = request.get('client_addr')  # Client address if provided through the request
+        Returns:
+            Response dict
+        """
+        # Copying a dict with string keys is a single C call under the GIL, so this
+        # read needs no lock and never waits behind heartbeats
+        response = {
+            'status': 'success',
+            'accounts': list(self.account_nodes)
+        }
+        
+        return response
+    
+    def handle_simulate_failure(self, request, client):
+        """
+        Mark a node as failed and promote its backup, for failover demos.
+        
+        Args:
+            request: Decoded request
+            client: Socket connection to the client
+            
+        Returns:
+            Response dict
+        """
+        # Command to simulate node failure
+        node_id = request.get('node_id')
+        
+        with self.lock:
+            if node_id in self.account_nodes:
+                # 1. First unconditionally mark the node as failed
+                log.info("Node %s status before simulation: %s", node_id, self.account_nodes[node_id].get('status', 'active'))
+                self.account_nodes[node_id]['status'] = 'failed'
+                self.account_nodes[node_id]['failure_time'] = time.time()
+                log.info("Node %s has been marked as failed: %s", node_id, self.account_nodes[node_id])
                 
-                if node_type == 'account':
-                    with self.lock:
-                        # Record client address if provided; otherwise use connection address
-                        if not client_addr:
-                            client_addr, _ = client.getpeername()
-                        
-                        # Store node host mapping
-                        self.node_hosts[node_id] = client_addr
+                # 2. Immediately log state changes to disk
+                self.log_node(node_id)
+                
+                # 3. Confirm the node status has been changed
+                assert self.account_nodes[node_id]['status'] == 'failed', "Node status was not changed successfully!"
+                log.info("Confirmed node %s status has been updated to: %s", node_id, self.account_nodes[node_id].get('status'))
+                
+                # 4. Build basic response
+                backup_node_id = self.node_pairs.get(node_id)
+                response = {
+                    'status': 'success',
+                    'message': f'Node {node_id} has been marked as failed',
+                    'backup_node': backup_node_id,
+                    'node_status': self.account_nodes[node_id].get('status')
+                }
+                
+                # 5. Try to promote backup node, but this doesn't affect the failed status of the node
+                backup_promoted = False
+                if backup_node_id and backup_node_id in self.account_nodes:
+                    log.info("Attempting to promote backup node %s to take over for %s", backup_node_id, node_id)
+                    
+                    # First update the backup node role to primary in the coordinator
+                    try:
+                        previous_role = self.account_nodes[backup_node_id].get('role', 'backup')
+                        self.account_nodes[backup_node_id]['role'] = 'primary'
+                        log.info("Backup node %s role updated from %s to %s", backup_node_id, previous_role, self.account_nodes[backup_node_id]['role'])
                         
-                        # Check if node already exists
-                        if node_id in self.account_nodes:
-                            # Node exists, update selectively
-                            existing_node_info = self.account_nodes[node_id]
-
-                            # If node is marked as failed, only update heartbeat time, do not change status/role
-                            if existing_node_info.get('status') == 'failed':
-                                print(f"Received heartbeat from failed node {node_id}. Ignoring role/status update.")
-                                existing_node_info['last_heartbeat'] = time.time()
-                                # Optionally update port if it can change dynamically
-                                # existing_node_info['port'] = port
-                                response = {
-                                    'status': 'success',
-                                    'message': 'Heartbeat received from failed node, status unchanged'
-                                }
-                            else:
-                                # Node is active, update normally but preserve existing status if any
-                                existing_node_info['port'] = port
-                                existing_node_info['last_heartbeat'] = time.time()
-                                # Only update role if it's not explicitly set to something else by coordinator logic
-                                # For now, let's keep the role reported by the heartbeat unless coordinator logic changed it
-                                existing_node_info['role'] = role_from_heartbeat
-                                print(f"Updated existing node {node_id} info from heartbeat.")
-                                response = {
-                                    'status': 'success',
-                                    'message': 'Heartbeat received and node info updated'
-                                }
-                                # Re-evaluate pairing based on updated info if necessary (e.g., role changed)
-                                # This part might need refinement depending on role change handling
-                        else:
-                            # New node, create entry
-                            self.account_nodes[node_id] = {
-                                'port': port,
-                                'last_heartbeat': time.time(),
-                                'role': role_from_heartbeat # Use role from heartbeat for new nodes
-                            }
-                            print(f"Registered new node {node_id} from heartbeat.")
-                            response = {
-                                'status': 'success',
-                                'message': 'Heartbeat received, new node registered'
-                            }
-
-                        # Handle primary-backup pairing regardless of new/existing if role is relevant
-                        current_role = self.account_nodes[node_id]['role']
-
-                        # If this is a primary node trying to pair
-                        if current_role == 'primary' and not backup_node and node_id not in self.node_pairs:
-                            backup_id = f"{node_id}b"
-                            if backup_id in self.account_nodes and self.account_nodes[backup_id]['role'] == 'backup':
-                                self.node_pairs[node_id] = backup_id
-                                response['backup_assigned'] = True
-                                response['backup_info'] = {'node_id': backup_id, 'port': self.account_nodes[backup_id]['port']}
-                                print(f"Paired primary {node_id} with backup {backup_id} via heartbeat.")
-
-                        # If this is a backup node trying to pair
-                        elif current_role == 'backup' and not primary_node:
-                             if node_id.endswith('b') and len(node_id) > 1:
-                                primary_id = node_id[:-1]
-                                # Check if primary exists and is not already paired
-                                if primary_id in self.account_nodes and self.account_nodes[primary_id]['role'] == 'primary' and primary_id not in self.node_pairs:
-                                    self.node_pairs[primary_id] = node_id
-                                    response['primary_assigned'] = True
-                                    response['primary_info'] = {'node_id': primary_id, 'port': self.account_nodes[primary_id]['port']}
-                                    print(f"Paired backup {node_id} with primary {primary_id} via heartbeat.")
-
-                        self.save_data()
+                        # Update node pairing relationships
+                        self.unpair_node(node_id)
+                        self.log_node(backup_node_id)
+                        self.log_pair(node_id)
+                        backup_promoted = True
+                        log.info("Backup node %s has been promoted to primary in the coordinator", backup_node_id)
+                    except Exception as e:
+                        log.error("Error during backup node promotion: %s", e)
+                
+                # 6. Final status check and confirmation
+                log.info("Final confirmation of node %s status: %s", node_id, self.account_nodes[node_id].get('status', 'unknown'))
+                if backup_node_id:
+                    log.info("Final confirmation of backup node %s role: %s", backup_node_id, self.account_nodes[backup_node_id].get('role', 'unknown'))
+                
+                # 7. Update response to include backup promotion status
+                response['backup_promoted'] = backup_promoted
+                response['final_node_status'] = self.account_nodes[node_id].get('status')
+            else:
+                return {
+                    'status': 'error',
+                    'message': f'Node {node_id} does not exist'
+                }
+        
+        # Notify the backup node after releasing self.lock, and consider the promotion
+        # successful even if this fails; the coordinator state is already updated
+        if backup_promoted:
+            self.send_promotion_notice(backup_node_id)
+        
+        return response
+    
+    def handle_recover_node(self, request, client):
+        """
+        Bring a failed node back as primary, syncing its balance from the node that took over.
+        
+        Args:
+            request: Decoded request
+            client: Socket connection to the client
             
-            elif command == 'list_accounts':
-                with self.lock:
-                    response = {
-                        'status': 'success',
-                        'accounts': list(self.account_nodes.keys())
-                    }
+        Returns:
+            Response dict
+        """
+        # Command to recover a node
+        node_id = request.get('node_id') # The node being recovered (e.g., a1)
+        
+        # self.lock is only held to check and change coordinator state; the node RPCs
+        # in between run without it so a slow node never stalls heartbeats
+        with self.lock:
+            if node_id not in self.account_nodes:
+                return {
+                    'status': 'error',
+                    'message': f'Node {node_id} does not exist'
+                }
             
-            elif command == 'simulate_failure':
-                # Command to simulate node failure
-                node_id = request.get('node_id')
-                
-                with self.lock:
-                    if node_id in self.account_nodes:
-                        # 1. First unconditionally mark the node as failed
-                        print(f"Node {node_id} status before simulation: {self.account_nodes[node_id].get('status', 'active')}")
-                        self.account_nodes[node_id]['status'] = 'failed'
-                        self.account_nodes[node_id]['failure_time'] = time.time()
-                        print(f"Node {node_id} has been marked as failed: {self.account_nodes[node_id]}")
-                        
-                        # 2. Immediately save state changes to disk
-                        self.save_data()
-                        
-                        # 3. Confirm the node status has been changed
-                        assert self.account_nodes[node_id]['status'] == 'failed', "Node status was not changed successfully!"
-                        print(f"Confirmed node {node_id} status has been updated to: {self.account_nodes[node_id].get('status')}")
-                        
-                        # 4. Build basic response
-                        backup_node_id = self.node_pairs.get(node_id)
-                        response = {
-                            'status': 'success',
-                            'message': f'Node {node_id} has been marked as failed',
-                            'backup_node': backup_node_id,
-                            'node_status': self.account_nodes[node_id].get('status')
-                        }
-                        
-                        # 5. Try to promote backup node, but this doesn't affect the failed status of the node
-                        backup_promoted = False
-                        if backup_node_id and backup_node_id in self.account_nodes:
-                            print(f"Attempting to promote backup node {backup_node_id} to take over for {node_id}")
-                            
-                            # First update the backup node role to primary in the coordinator
-                            try:
-                                previous_role = self.account_nodes[backup_node_id].get('role', 'backup')
-                                self.account_nodes[backup_node_id]['role'] = 'primary'
-                                print(f"Backup node {backup_node_id} role updated from {previous_role} to {self.account_nodes[backup_node_id]['role']}")
-                                
-                                # Update node pairing relationships
-                                self.node_pairs.pop(node_id, None)
-                                self.save_data()
-                                backup_promoted = True
-                                print(f"Backup node {backup_node_id} has been promoted to primary in the coordinator")
-                                
-                                # Try to notify the backup node, but consider it successful even if this fails
-                                try:
-                                    backup_port = self.account_nodes[backup_node_id]['port']
-                                    host = self.node_hosts.get(backup_node_id, 'localhost')
-                                    
-                                    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                                        s.settimeout(2)  # Short timeout to avoid long waits
-                                        s.connect((host, backup_port))
-                                        promote_request = {
-                                            'command': 'become_primary'
-                                        }
-                                        s.send(json.dumps(promote_request).encode('utf-8'))
-                                        # Ignore response, we've already updated the status in the coordinator
-                                except Exception as e:
-                                    print(f"Error while notifying the backup node, but this doesn't affect the status update: {e}")
-                            except Exception as e:
-                                print(f"Error during backup node promotion: {e}")
-                        
-                        # 6. Final status check and confirmation
-                        print(f"Final confirmation of node {node_id} status: {self.account_nodes[node_id].get('status', 'unknown')}")
-                        if backup_node_id:
-                            print(f"Final confirmation of backup node {backup_node_id} role: {self.account_nodes[backup_node_id].get('role', 'unknown')}")
-                        
-                        # 7. Update response to include backup promotion status
-                        response['backup_promoted'] = backup_promoted
-                        response['final_node_status'] = self.account_nodes[node_id].get('status')
-                    else:
-                        response = {
-                            'status': 'error',
-                            'message': f'Node {node_id} does not exist'
-                        }
+            log.info("Node %s status before recovery: %s", node_id, self.account_nodes[node_id].get('status', 'active'))
+            if self.account_nodes[node_id].get('status') != 'failed':
+                log.info("Node %s is not currently in failed state: %s", node_id, self.account_nodes[node_id])
+                return {
+                    'status': 'error',
+                    'message': f'Node {node_id} is not currently in failed state',
+                    'node_info': dict(self.account_nodes[node_id])
+                }
             
-            elif command == 'recover_node':
-                # Command to recover a node
-                node_id = request.get('node_id') # The node being recovered (e.g., a1)
-                
-                with self.lock:
-                    if node_id in self.account_nodes:
-                        print(f"Node {node_id} status before recovery: {self.account_nodes[node_id].get('status', 'active')}")
-                        
-                        if self.account_nodes[node_id].get('status') == 'failed':
-                            # Node is indeed marked as failed, proceed with recovery
-                            
-                            # Step 1: Find the node that took over (the original backup, now primary)
-                            potential_takeover_node_id = f"{node_id}b"
-                            takeover_node_info = self.account_nodes.get(potential_takeover_node_id)
-                            
-                            latest_balance = None
-                            sync_success = False
-
-                            if takeover_node_info and takeover_node_info.get('role') == 'primary':
-                                print(f"Found takeover node {potential_takeover_node_id}, attempting to sync state...")
-                                try:
-                                    # Step 2: Get the current balance from the takeover node
-                                    host = self.node_hosts.get(potential_takeover_node_id, 'localhost')
-                                    port = takeover_node_info['port']
-                                    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                                        s.settimeout(3)
-                                        s.connect((host, port))
-                                        s.send(json.dumps({'command': 'get_balance'}).encode('utf-8'))
-                                        balance_response_data = s.recv(4096)
-                                        balance_response = json.loads(balance_response_data.decode('utf-8'))
-                                        
-                                        if balance_response.get('status') == 'success':
-                                            latest_balance = balance_response.get('balance')
-                                            print(f"Retrieved latest balance from {potential_takeover_node_id}: {latest_balance}")
-                                        else:
-                                            print(f"Unable to retrieve balance from {potential_takeover_node_id}: {balance_response.get('message')}")
-                                
-                                except Exception as e:
-                                    print(f"Error connecting to takeover node {potential_takeover_node_id} to get balance: {e}")
+            # Node is indeed marked as failed, proceed with recovery
+            # Step 1: Find the node that took over (the original backup, now primary)
+            potential_takeover_node_id = f"{node_id}b"
+            takeover_node_info = self.account_nodes.get(potential_takeover_node_id)
+            has_takeover = bool(takeover_node_info and takeover_node_info.get('role') == 'primary')
+            promotion_notice = self.promotion_notices.get(potential_takeover_node_id)
+        
+        # A become_primary still in flight must not reach the takeover node after become_backup
+        if promotion_notice is not None:
+            promotion_notice.result()
+        
+        latest_balance = None
+        sync_success = False
 
-                                # Step 3: If balance was obtained, force set it on the recovering node
-                                if latest_balance is not None:
-                                    try:
-                                        recovering_node_info = self.account_nodes[node_id]
-                                        host = self.node_hosts.get(node_id, 'localhost')
-                                        port = recovering_node_info['port']
-                                        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                                            s.settimeout(3)
-                                            s.connect((host, port))
-                                            force_set_req = {
-                                                'command': 'force_set_balance', # Requires account_node to handle this
-                                                'balance': latest_balance
-                                            }
-                                            s.send(json.dumps(force_set_req).encode('utf-8'))
-                                            set_response_data = s.recv(4096)
-                                            set_response = json.loads(set_response_data.decode('utf-8'))
-                                            
-                                            if set_response.get('status') == 'success':
-                                                sync_success = True
-                                                print(f"Successfully synchronized latest balance to recovering node {node_id}")
-                                            else:
-                                                 print(f"Node {node_id} balance synchronization failed: {set_response.get('message')}")
-                                    except Exception as e:
-                                        print(f"Error connecting to recovering node {node_id} to set balance: {e}")
-                            else:
-                                print(f"Warning: No valid takeover node {potential_takeover_node_id} found to sync state. Node {node_id} will recover using its local state.")
-                                # Decide if recovery should proceed without sync or fail
-                                # For simulation, we might allow it, but log a warning.
-                                sync_success = True # Allow recovery without sync for now
+        if has_takeover:
+            log.info("Found takeover node %s, attempting to sync state...", potential_takeover_node_id)
+            try:
+                # Step 2: Get the current balance from the takeover node
+                balance_response = self.rpc(potential_takeover_node_id, {'command': 'get_balance'}, timeout=3)
+                
+                if balance_response.get('status') == 'success':
+                    latest_balance = balance_response.get('balance')
+                    log.info("Retrieved latest balance from %s: %s", potential_takeover_node_id, latest_balance)
+                else:
+                    log.warning("Unable to retrieve balance from %s: %s", potential_takeover_node_id, balance_response.get('message'))
+            
+            except Exception as e:
+                log.error("Error connecting to takeover node %s to get balance: %s", potential_takeover_node_id, e)
 
-                            # Step 4: If sync was successful (or skipped), mark the node as active and restore primary/backup roles
-                            if sync_success:
-                                # Mark the recovering node as active and ensure it's primary
-                                self.account_nodes[node_id]['role'] = 'primary' # Explicitly set recovered node to primary
-                                self.account_nodes[node_id].pop('status', None)
-                                self.account_nodes[node_id].pop('failure_time', None)
-                                print(f"Node {node_id} has been marked as active and role set to 'primary'")
+            # Step 3: If balance was obtained, force set it on the recovering node
+            if latest_balance is not None:
+                try:
+                    force_set_req = {
+                        'command': 'force_set_balance', # Requires account_node to handle this
+                        'balance': latest_balance
+                    }
+                    set_response = self.rpc(node_id, force_set_req, timeout=3)
+                    
+                    if set_response.get('status') == 'success':
+                        sync_success = True
+                        log.info("Successfully synchronized latest balance to recovering node %s", node_id)
+                    else:
+                         log.warning("Node %s balance synchronization failed: %s", node_id, set_response.get('message'))
+                except Exception as e:
+                    log.error("Error connecting to recovering node %s to set balance: %s", node_id, e)
+        else:
+            log.warning("No valid takeover node %s found to sync state. Node %s will recover using its local state.", potential_takeover_node_id, node_id)
+            # Decide if recovery should proceed without sync or fail
+            # For simulation, we might allow it, but log a warning.
+            sync_success = True # Allow recovery without sync for now
 
-                                # Step 5: Reset the takeover node (original backup) back to 'backup' role
-                                if takeover_node_info and takeover_node_info.get('role') == 'primary':
-                                    print(f"Attempting to reset takeover node {potential_takeover_node_id} role to 'backup'")
-                                    try:
-                                        # Notify the takeover node to become backup
-                                        takeover_host = self.node_hosts.get(potential_takeover_node_id, 'localhost')
-                                        takeover_port = takeover_node_info['port']
-                                        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                                            s.settimeout(2)
-                                            s.connect((takeover_host, takeover_port))
-                                            become_backup_req = {'command': 'become_backup'} # Node needs to handle this
-                                            s.send(json.dumps(become_backup_req).encode('utf-8'))
-                                            # We don't necessarily need to wait for a response, but log if node acknowledged
-                                            try:
-                                                backup_res_data = s.recv(1024)
-                                                backup_res = json.loads(backup_res_data.decode('utf-8'))
-                                                if backup_res.get('status') == 'success':
-                                                    print(f"Node {potential_takeover_node_id} confirmed switch back to backup role")
-                                                else:
-                                                    print(f"Warning: Node {potential_takeover_node_id} returned error when switching to backup: {backup_res.get('message')}")
-                                            except socket.timeout:
-                                                print(f"Warning: Timeout waiting for node {potential_takeover_node_id} to confirm switch to backup")
-                                            except Exception as e_recv:
-                                                print(f"Warning: Error reading response from node {potential_takeover_node_id} switch to backup: {e_recv}")
+        if not sync_success:
+            log.warning("Node %s state synchronization failed, recovery aborted.", node_id)
+            return {
+                'status': 'error',
+                'message': f'Node {node_id} state synchronization failed, cannot recover.'
+            }
 
-                                        # Update coordinator state regardless of notification success
-                                        self.account_nodes[potential_takeover_node_id]['role'] = 'backup'
-                                        # Re-establish the pairing in node_pairs
-                                        self.node_pairs[node_id] = potential_takeover_node_id
-                                        print(f"Coordinator has updated node {potential_takeover_node_id} role to 'backup' and restored pairing relationship {node_id} -> {potential_takeover_node_id}")
+        # Step 4: Notify the takeover node (original backup) to switch back to 'backup' role
+        if has_takeover:
+            log.info("Attempting to reset takeover node %s role to 'backup'", potential_takeover_node_id)
+            try:
+                become_backup_req = {'command': 'become_backup'} # Node needs to handle this
+                backup_res = self.rpc(potential_takeover_node_id, become_backup_req, timeout=2)
+                if backup_res.get('status') == 'success':
+                    log.info("Node %s confirmed switch back to backup role", potential_takeover_node_id)
+                else:
+                    log.warning("Node %s returned error when switching to backup: %s", potential_takeover_node_id, backup_res.get('message'))
+            except socket.timeout:
+                log.warning("Timeout waiting for node %s to confirm switch to backup", potential_takeover_node_id)
+            except Exception as e_notify:
+                # Coordinator state is updated below regardless, at the risk of disagreeing with the node
+                log.error("Failed to notify node %s to switch to backup: %s. Coordinator state may be inconsistent with node state!", potential_takeover_node_id, e_notify)
+        else:
+            log.info("No takeover node %s found or its role is not primary, no need to reset role", potential_takeover_node_id)
 
-                                    except Exception as e_notify:
-                                        print(f"Error: Failed to notify node {potential_takeover_node_id} to switch to backup: {e_notify}. Coordinator state may be inconsistent with node state!")
-                                        # Decide on error handling: proceed with coordinator state update?
-                                        # For now, let's update coordinator state but log the inconsistency risk
-                                        self.account_nodes[potential_takeover_node_id]['role'] = 'backup'
-                                        self.node_pairs[node_id] = potential_takeover_node_id
-                                        print(f"Warning: Despite notification failure, coordinator has set {potential_takeover_node_id} role to 'backup' and restored pairing")
-                                else:
-                                    print(f"No takeover node {potential_takeover_node_id} found or its role is not primary, no need to reset role")
+        with self.lock:
+            # Another recover_node request may have finished while the RPCs were in flight
+            if self.account_nodes.get(node_id, {}).get('status') != 'failed':
+                return {
+                    'status': 'error',
+                    'message': f'Node {node_id} is not currently in failed state',
+                    'node_info': dict(self.account_nodes.get(node_id, {}))
+                }
+            
+            # Step 5: Mark the recovering node as active and ensure it's primary
+            self.account_nodes[node_id]['role'] = 'primary' # Explicitly set recovered node to primary
+            self.account_nodes[node_id].pop('status', None)
+            self.account_nodes[node_id].pop('failure_time', None)
+            log.info("Node %s has been marked as active and role set to 'primary'", node_id)
 
+            # Update coordinator state regardless of notification success
+            if has_takeover and potential_takeover_node_id in self.account_nodes:
+                self.account_nodes[potential_takeover_node_id]['role'] = 'backup'
+                # Re-establish the pairing in node_pairs
+                self.pair_nodes(node_id, potential_takeover_node_id)
+                log.info("Coordinator has updated node %s role to 'backup' and restored pairing relationship %s -> %s", potential_takeover_node_id, node_id, potential_takeover_node_id)
 
-                                # Step 6: Save final state and prepare response
-                                print(f"Final confirmation of node {node_id} state: {self.account_nodes[node_id]}")
-                                if potential_takeover_node_id in self.account_nodes:
-                                     print(f"Final confirmation of node {potential_takeover_node_id} state: {self.account_nodes[potential_takeover_node_id]}")
-                                print(f"Final confirmation of pairing relationship: {self.node_pairs.get(node_id)}")
+            # Step 6: Save final state and prepare response
+            log.info("Final confirmation of node %s state: %s", node_id, self.account_nodes[node_id])
+            if potential_takeover_node_id in self.account_nodes:
+                 log.info("Final confirmation of node %s state: %s", potential_takeover_node_id, self.account_nodes[potential_takeover_node_id])
+            log.info("Final confirmation of pairing relationship: %s", self.node_pairs.get(node_id))
 
-                                self.save_data()
-                                print(f"Confirmed node {node_id} current status: {self.account_nodes[node_id].get('status', 'active')}, role: {self.account_nodes[node_id].get('role')}")
-                                if potential_takeover_node_id in self.account_nodes:
-                                    print(f"Confirmed node {potential_takeover_node_id} current status: {self.account_nodes[potential_takeover_node_id].get('status', 'active')}, role: {self.account_nodes[potential_takeover_node_id].get('role')}")
+            self.log_node(node_id)
+            if potential_takeover_node_id in self.account_nodes:
+                self.log_node(potential_takeover_node_id)
+            self.log_pair(node_id)
+            log.info("Confirmed node %s current status: %s, role: %s", node_id, self.account_nodes[node_id].get('status', 'active'), self.account_nodes[node_id].get('role'))
+            if potential_takeover_node_id in self.account_nodes:
+                log.info("Confirmed node %s current status: %s, role: %s", potential_takeover_node_id, self.account_nodes[potential_takeover_node_id].get('status', 'active'), self.account_nodes[potential_takeover_node_id].get('role'))
 
-                                response = {
-                                    'status': 'success',
-                                    'message': f'Node {node_id} has been restored to normal state and set as primary. Node {potential_takeover_node_id} has been reset to backup.' + (' (Latest balance synchronized)' if latest_balance is not None else ' (State synchronization not performed)'),
-                                    'node_info': self.account_nodes[node_id],
-                                    'backup_node_info': self.account_nodes.get(potential_takeover_node_id)
-                                }
-                            else:
-                                print(f"Node {node_id} state synchronization failed, recovery aborted.")
-                                response = {
-                                    'status': 'error',
-                                    'message': f'Node {node_id} state synchronization failed, cannot recover.'
-                                }
-                        else:
-                            print(f"Node {node_id} is not currently in failed state: {self.account_nodes[node_id]}")
-                            response = {
-                                'status': 'error',
-                                'message': f'Node {node_id} is not currently in failed state',
-                                'node_info': self.account_nodes[node_id]
-                            }
-                    else:
-                        response = {
-                            'status': 'error',
-                            'message': f'Node {node_id} does not exist'
-                        }
+            takeover_record = self.account_nodes.get(potential_takeover_node_id)
+            response = {
+                'status': 'success',
+                'message': f'Node {node_id} has been restored to normal state and set as primary. Node {potential_takeover_node_id} has been reset to backup.' + (' (Latest balance synchronized)' if latest_balance is not None else ' (State synchronization not performed)'),
+                'node_info': dict(self.account_nodes[node_id]),
+                'backup_node_info': dict(takeover_record) if takeover_record is not None else None
+            }
+        
+        return response
+    
+    def handle_check_node_status(self, request, client):
+        """
+        Report the status, role and pairing of a node.
+        
+        Args:
+            request: Decoded request
+            client: Socket connection to the client
             
-            elif command == 'check_node_status':
-                # Command to check node status
-                node_id = request.get('node_id')
-                
-                with self.lock:
-                    if node_id in self.account_nodes:
-                        node_info = self.account_nodes[node_id]
-                        # Directly check if status field is 'failed'
-                        is_failed = node_info.get('status') == 'failed'
-                        is_active = not is_failed
-                        backup_node_id = self.node_pairs.get(node_id)
-                        
-                        # Debug information
-                        print(f"DEBUG - Node info: {node_info}")
-                        print(f"DEBUG - Node {node_id} status: {'failed' if is_failed else 'active'}")
-                        
-                        # Get all status information directly from memory
-                        response = {
-                            'status': 'success',
-                            'node_id': node_id,
-                            'is_active': is_active,
-                            'role': node_info.get('role', 'primary'),
-                            'backup_node': backup_node_id,
-                            'state': 'failed' if is_failed else 'active',  # Ensure state is consistent with is_active
-                            'node_info': node_info,  # Return complete node info for debugging
-                            'last_heartbeat': node_info.get('last_heartbeat'),
-                            'port': node_info.get('port')
-                        }
-                    else:
-                        response = {
-                            'status': 'error',
-                            'message': f'Node {node_id} does not exist'
-                        }
+        Returns:
+            Response dict
+        """
+        # Command to check node status
+        node_id = request.get('node_id')
+        
+        # Read without self.lock: every field below comes from one copy of the node
+        # record (an atomic dict copy under the GIL), so the reply is self-consistent
+        # and is encoded without the live record changing underneath it
+        node_info = self.account_nodes.get(node_id)
+        if node_info is not None:
+            node_info = dict(node_info)
+            # Directly check if status field is 'failed'
+            is_failed = node_info.get('status') == 'failed'
+            is_active = not is_failed
+            backup_node_id = self.node_pairs.get(node_id)
             
-            elif command == 'transfer':
-                # Handle transfer request
-                from_account = request.get('from')
-                to_account = request.get('to')
-                amount = request.get('amount')
-                
-                # Record original account IDs
-                original_from = from_account
-                original_to = to_account
-                
-                if from_account not in self.account_nodes or to_account not in self.account_nodes:
-                    response = {
+            # Debug information
+            log.debug("Node info: %s", node_info)
+            log.debug("Node %s status: %s", node_id, 'failed' if is_failed else 'active')
+            
+            # Get all status information directly from memory
+            response = {
+                'status': 'success',
+                'node_id': node_id,
+                'is_active': is_active,
+                'role': node_info.get('role', 'primary'),
+                'backup_node': backup_node_id,
+                'state': 'failed' if is_failed else 'active',  # Ensure state is consistent with is_active
+                'node_info': node_info,  # Return complete node info for debugging
+                'last_heartbeat': node_info.get('last_heartbeat'),
+                'port': node_info.get('port')
+            }
+        else:
+            response = {
+                'status': 'error',
+                'message': f'Node {node_id} does not exist'
+            }
+        
+        return response
+    
+    def handle_transfer(self, request, client):
+        """
+        Transfer money between two accounts with two-phase commit, redirecting failed nodes to their takeover node.
+        
+        Args:
+            request: Decoded request
+            client: Socket connection to the client
+            
+        Returns:
+            Response dict
+        """
+        # Handle transfer request
+        from_account = request.get('from')
+        to_account = request.get('to')
+        amount = request.get('amount')
+        
+        # Record original account IDs
+        original_from = from_account
+        original_to = to_account
+        
+        if from_account not in self.account_nodes or to_account not in self.account_nodes:
+            response = {
+                'status': 'error',
+                'message': 'One or both accounts do not exist'
+            }
+        else:
+            # Check node status, if failed immediately redirect to the node that took over
+            redirected = False
+            if self.account_nodes[from_account].get('status') == 'failed':
+                takeover_id = self.takeover_node(from_account)
+                if takeover_id is None:
+                    return {
                         'status': 'error',
-                        'message': 'One or both accounts do not exist'
+                        'message': f'Source account {original_from} is currently unavailable and has no available takeover node'
                     }
-                else:
-                    # Check node status, if failed immediately redirect to backup node
-                    from_node_failed = self.account_nodes.get(from_account, {}).get('status') == 'failed'
-                    to_node_failed = self.account_nodes.get(to_account, {}).get('status') == 'failed'
-                    
-                    # If source account node failed, redirect to backup
-                    redirected = False
-                    if from_node_failed:
-                        backup_from = self.node_pairs.get(from_account)
-                        if backup_from and backup_from in self.account_nodes:
-                            print(f"Source account {from_account} has failed, redirecting to backup node {backup_from}")
-                            from_account = backup_from
-                            redirected = True
-                        else:
-                            # NEW LOGIC: If not in node_pairs, try deducing backup ID and check if it's the new primary
-                            potential_backup_id = f"{from_account}b"
-                            if potential_backup_id in self.account_nodes and self.account_nodes[potential_backup_id].get('role') == 'primary':
-                                print(f"Source account {from_account} has failed, redirecting to backup node {potential_backup_id} that has been promoted to primary")
-                                from_account = potential_backup_id
-                                redirected = True
-                            else:
-                                response = {
-                                    'status': 'error',
-                                    'message': f'Source account {original_from} is currently unavailable and has no available takeover node' # Use original ID in error message
-                                }
-                                client.send(json.dumps(response).encode('utf-8'))
-                                return
+                log.info("Source account %s has failed, redirecting to takeover node %s", from_account, takeover_id)
+                from_account = takeover_id
+                redirected = True
 
-                    # If target account node failed, redirect to backup
-                    if to_node_failed:
-                        backup_to = self.node_pairs.get(to_account)
-                        if backup_to and backup_to in self.account_nodes:
-                            print(f"Target account {to_account} has failed, redirecting to backup node {backup_to}")
-                            to_account = backup_to
-                            redirected = True
-                        else:
-                            # NEW LOGIC: If not in node_pairs, try deducing backup ID and check if it's the new primary
-                            potential_backup_id = f"{to_account}b"
-                            if potential_backup_id in self.account_nodes and self.account_nodes[potential_backup_id].get('role') == 'primary':
-                                print(f"Target account {to_account} has failed, redirecting to backup node {potential_backup_id} that has been promoted to primary")
-                                to_account = potential_backup_id
-                                redirected = True
-                            else:
-                                response = {
-                                    'status': 'error',
-                                    'message': f'Target account {original_to} is currently unavailable and has no available takeover node' # Use original ID in error message
-                                }
-                                client.send(json.dumps(response).encode('utf-8'))
-                                return
-                    
-                    # Start two-phase commit protocol
-                    transaction_id = str(uuid.uuid4())
-                    success = self.execute_two_phase_commit(transaction_id, from_account, to_account, amount)
-                    
-                    if success:
-                        response = {
-                            'status': 'success',
-                            'message': f'From {original_from} to {original_to} {amount} transfer completed',
-                            'transaction_id': transaction_id,
-                            'used_backup': redirected
-                        }
-                    else:
-                        response = {
-                            'status': 'error',
-                            'message': 'Transfer failed in two-phase commit process'
-                        }
+            if self.account_nodes[to_account].get('status') == 'failed':
+                takeover_id = self.takeover_node(to_account)
+                if takeover_id is None:
+                    return {
+                        'status': 'error',
+                        'message': f'Target account {original_to} is currently unavailable and has no available takeover node'
+                    }
+                log.info("Target account %s has failed, redirecting to takeover node %s", to_account, takeover_id)
+                to_account = takeover_id
+                redirected = True
+            
+            # Start two-phase commit protocol
+            transaction_id = str(uuid.uuid4())
+            success = self.execute_two_phase_commit(transaction_id, from_account, to_account, amount)
+            
+            if success:
+                response = {
+                    'status': 'success',
+                    'message': f'From {original_from} to {original_to} {amount} transfer completed',
+                    'transaction_id': transaction_id,
+                    'used_backup': redirected
+                }
+            else:
+                response = {
+                    'status': 'error',
+                    'message': 'Transfer failed in two-phase commit process'
+                }
+        
+        return response
+    
+    def handle_get_balance(self, request, client):
+        """
+        Forward a balance query to the account node, or to its takeover node if it failed.
+        
+        Args:
+            request: Decoded request
+            client: Socket connection to the client
+            
+        Returns:
+            Response dict
+        """
+        # Handle balance query request
+        account_id = request.get('account_id')
+        
+        if account_id not in self.account_nodes:
+            response = {
+                'status': 'error',
+                'message': f'Account {account_id} not found'
+            }
+        else:
+            # Record original account ID for response display
+            original_account = account_id
+            
+            # Check node status, if failed immediately redirect to the node that took over
+            if self.account_nodes[account_id].get('status') == 'failed':
+                account_id = self.takeover_node(account_id)
+                if account_id is None:
+                    return {
+                        'status': 'error',
+                        'message': f'Account {original_account} is currently unavailable and has no available takeover node'
+                    }
+                log.info("Account %s has failed, redirecting to takeover node %s", original_account, account_id)
             
-            elif command == 'get_balance':
-                # Handle balance query request
-                account_id = request.get('account_id')
+            # Forward request to account node
+            try:
+                balance_request = {
+                    'command': 'get_balance'
+                }
+                balance_response = self.rpc(account_id, balance_request, timeout=3)  # Short timeout, avoid long waits
                 
-                if account_id not in self.account_nodes:
+                if balance_response.get('status') == 'success':
                     response = {
-                        'status': 'error',
-                        'message': f'Account {account_id} not found'
+                        'status': 'success',
+                        'balance': balance_response.get('balance'),
+                        'account_id': account_id,
+                        'used_backup': (account_id != original_account)
                     }
                 else:
-                    # Record original account ID for response display
-                    original_account = account_id
-                    
-                    # Check node status, if failed immediately redirect to backup node
-                    node_failed = self.account_nodes.get(account_id, {}).get('status') == 'failed'
-                    
-                    if node_failed:
-                        backup_id = self.node_pairs.get(account_id)
-                        if backup_id and backup_id in self.account_nodes:
-                            print(f"Account {account_id} has failed, redirecting to backup node {backup_id}")
-                            account_id = backup_id
-                        else:
-                            # NEW LOGIC: If not in node_pairs, try deducing backup ID and check if it's the new primary
-                            potential_backup_id = f"{account_id}b"
-                            if potential_backup_id in self.account_nodes and self.account_nodes[potential_backup_id].get('role') == 'primary':
-                                print(f"Account {original_account} has failed, redirecting to backup node {potential_backup_id} that has been promoted to primary")
-                                account_id = potential_backup_id # Update account_id to the promoted node
-                            else:
-                                response = {
-                                    'status': 'error',
-                                    'message': f'Account {original_account} is currently unavailable and has no available takeover node' # Use original ID in error message
-                                }
-                                client.send(json.dumps(response).encode('utf-8'))
-                                return
-                    
-                    # Forward request to account node
-                    try:
-                        node_info = self.account_nodes[account_id]
-                        host = self.node_hosts.get(account_id, 'localhost')
-                        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                            s.settimeout(3)  # Increase timeout to 3 seconds, avoid long waits
-                            s.connect((host, node_info['port']))
-                            balance_request = {
-                                'command': 'get_balance'
-                            }
-                            s.send(json.dumps(balance_request).encode('utf-8'))
-                            balance_response = json.loads(s.recv(4096).decode('utf-8'))
-                            
-                            if balance_response.get('status') == 'success':
-                                response = {
-                                    'status': 'success',
-                                    'balance': balance_response.get('balance'),
-                                    'account_id': account_id,
-                                    'used_backup': (account_id != original_account)
-                                }
-                            else:
-                                response = {
-                                    'status': 'error',
-                                    'message': f'Unable to retrieve balance from account {account_id}'
-                                }
-                    except Exception as e:
-                        response = {
-                            'status': 'error',
-                            'message': f'Error accessing account {account_id}: {str(e)}'
-                        }
+                    response = {
+                        'status': 'error',
+                        'message': f'Unable to retrieve balance from account {account_id}'
+                    }
+            except Exception as e:
+                response = {
+                    'status': 'error',
+                    'message': f'Error accessing account {account_id}: {str(e)}'
+                }
+        
+        return response
+    
+    def handle_report_node_failure(self, request, client):
+        """
+        Handle a failure report sent by the backup of a primary node.
+        
+        Args:
+            request: Decoded request
+            client: Socket connection to the client
             
-            elif command == 'report_node_failure':
-                # Handle node failure report from a backup node
-                reporter_id = request.get('reporter')
-                failed_node_id = request.get('failed_node')
-                reporter_role = request.get('reporter_role')
-                
-                if reporter_role == 'backup' and failed_node_id:
-                    # Verify that reporter is actually backup of the failed node
-                    is_valid_reporter = False
-                    
-                    for primary_id, backup_id in self.node_pairs.items():
-                        if primary_id == failed_node_id and backup_id == reporter_id:
-                            is_valid_reporter = True
-                            break
+        Returns:
+            Response dict, or pre-encoded bytes for canned responses
+        """
+        # Handle node failure report from a backup node
+        reporter_id = request.get('reporter')
+        failed_node_id = request.get('failed_node')
+        reporter_role = request.get('reporter_role')
+        
+        if reporter_role == 'backup' and failed_node_id:
+            # Verify that reporter is actually backup of the failed node
+            is_valid_reporter = self.backup_to_primary.get(reporter_id) == failed_node_id
+            
+            if is_valid_reporter and failed_node_id in self.account_nodes:
+                # Check if the node is already marked as failed (e.g., by monitor)
+                if self.account_nodes[failed_node_id].get('status') == 'failed':
+                    log.info("Received failure report for node %s, which is already marked as failed.", failed_node_id)
+                    # Node already marked as failed, just ensure backup is primary if needed
+                    if reporter_id in self.account_nodes and self.account_nodes[reporter_id].get('role') != 'primary':
+                        log.info("Ensuring reporter %s is primary.", reporter_id)
+                        self.promote_backup_to_primary(reporter_id, failed_node_id)
+                    response = {
+                        'status': 'success',
+                        'message': 'Failure report acknowledged for already failed node.'
+                    }
+                else:
+                    # NEW LOGIC: Additional verification before marking as failed
+                    # 1. Check when the last heartbeat was received from the reported node
+                    time_since_last_heartbeat = self.heartbeat_age(failed_node_id)
                     
-                    if is_valid_reporter and failed_node_id in self.account_nodes:
-                        # Check if the node is already marked as failed (e.g., by monitor)
-                        if self.account_nodes[failed_node_id].get('status') == 'failed':
-                            print(f"Received failure report for node {failed_node_id}, which is already marked as failed.")
-                            # Node already marked as failed, just ensure backup is primary if needed
-                            if reporter_id in self.account_nodes and self.account_nodes[reporter_id].get('role') != 'primary':
-                                print(f"Ensuring reporter {reporter_id} is primary.")
-                                self.promote_backup_to_primary(reporter_id, failed_node_id)
+                    # 2. Only act immediately if heartbeat is significantly old (15+ seconds)
+                    if time_since_last_heartbeat > 15:
+                        log.info("Verified failure report for node %s. Last heartbeat was %.1f seconds ago. Marking as failed and promoting backup.", failed_node_id, time_since_last_heartbeat)
+                        
+                        # Mark the node as failed
+                        with self.lock:
+                            self.account_nodes[failed_node_id]['status'] = 'failed'
+                            self.account_nodes[failed_node_id]['failure_time'] = time.time()
+                            self.log_node(failed_node_id) # Log the failed status
+
+                        # Promote the backup to primary
+                        promote_success = self.promote_backup_to_primary(reporter_id, failed_node_id)
+                        
+                        if promote_success:
                             response = {
                                 'status': 'success',
-                                'message': 'Failure report acknowledged for already failed node.'
+                                'message': 'Failure reported, node marked as failed, and backup promoted.'
                             }
                         else:
-                            # NEW LOGIC: Additional verification before marking as failed
-                            # 1. Check when the last heartbeat was received from the reported node
-                            current_time = time.time()
-                            last_heartbeat = self.account_nodes[failed_node_id].get('last_heartbeat', 0)
-                            time_since_last_heartbeat = current_time - last_heartbeat
-                            
-                            # 2. Only act immediately if heartbeat is significantly old (15+ seconds)
-                            if time_since_last_heartbeat > 15:
-                                print(f"Verified failure report for node {failed_node_id}. Last heartbeat was {time_since_last_heartbeat:.1f} seconds ago. Marking as failed and promoting backup.")
-                                
-                                # Mark the node as failed
-                                with self.lock:
-                                    self.account_nodes[failed_node_id]['status'] = 'failed'
-                                    self.account_nodes[failed_node_id]['failure_time'] = time.time()
-                                    self.save_data() # Save the failed status
-
-                                # Promote the backup to primary
-                                promote_success = self.promote_backup_to_primary(reporter_id, failed_node_id)
-                                
-                                if promote_success:
-                                    response = {
-                                        'status': 'success',
-                                        'message': 'Failure reported, node marked as failed, and backup promoted.'
-                                    }
-                                else:
-                                    response = {
-                                        'status': 'error',
-                                        'message': 'Failure reported and node marked as failed, but backup promotion failed.'
-                                    }
-                            else:
-                                # NEW LOGIC: Heartbeat is recent, log the report but don't act yet
-                                print(f"Received failure report for node {failed_node_id}, but last heartbeat was only {time_since_last_heartbeat:.1f} seconds ago. Logging report but delaying action.")
-                                # Note: We're acknowledging the report but not taking action yet
-                                # This allows automatic retry from the backup node
-                                response = {
-                                    'status': 'success',
-                                    'message': 'Failure report received, but action delayed due to recent heartbeat.',
-                                    'retry': True,
-                                    'heartbeat_age': time_since_last_heartbeat
-                                }
-                    elif not is_valid_reporter:
+                            response = {
+                                'status': 'error',
+                                'message': 'Failure reported and node marked as failed, but backup promotion failed.'
+                            }
+                    else:
+                        # NEW LOGIC: Heartbeat is recent, log the report but don't act yet
+                        log.info("Received failure report for node %s, but last heartbeat was only %.1f seconds ago. Logging report but delaying action.", failed_node_id, time_since_last_heartbeat)
+                        # Note: We're acknowledging the report but not taking action yet
+                        # This allows automatic retry from the backup node
                         response = {
-                            'status': 'error',
-                            'message': f'Invalid failure report: Reporter {reporter_id} is not the backup of {failed_node_id}.'
-                        }
-                    elif failed_node_id not in self.account_nodes:
-                         response = {
-                            'status': 'error',
-                            'message': f'Invalid failure report: Failed node {failed_node_id} not found.'
+                            'status': 'success',
+                            'message': 'Failure report received, but action delayed due to recent heartbeat.',
+                            'retry': True,
+                            'heartbeat_age': time_since_last_heartbeat
                         }
-                else:
-                    response = {
-                        'status': 'error',
-                        'message': 'Invalid failure report format'
-                    }
+            elif not is_valid_reporter:
+                response = {
+                    'status': 'error',
+                    'message': f'Invalid failure report: Reporter {reporter_id} is not the backup of {failed_node_id}.'
+                }
+            elif failed_node_id not in self.account_nodes:
+                 response = {
+                    'status': 'error',
+                    'message': f'Invalid failure report: Failed node {failed_node_id} not found.'
+                }
+        else:
+            response = INVALID_REPORT_RESPONSE
+        
+        return response
+    
+    def handle_init_accounts(self, request, client):
+        """
+        Set the balance of every primary account node.
+        
+        Args:
+            request: Decoded request
+            client: Socket connection to the client
+            
+        Returns:
+            Response dict
+        """
+        # Initialize accounts with initial balance
+        amount = request.get('amount', 10000)
+        
+        # Only initialize primary nodes (backups will be synced automatically)
+        primary_nodes = {n: info for n, info in self.account_nodes.items() 
+                        if info.get('role', 'primary') == 'primary'}
+        
+        # Initialize all primaries in parallel
+        results = self.rpc_pool.map(lambda node_id: self.init_account(node_id, amount), primary_nodes)
+        success = all(list(results))  # Wait for every node, not just the first failure
+        
+        if success:
+            response = {
+                'status': 'success',
+                'message': f'All accounts initialized with {amount}'
+            }
+        else:
+            response = {
+                'status': 'error',
+                'message': 'Failed to initialize all accounts'
+            }
+        
+        return response
+    
+    def handle_heartbeat(self, request, client):
+        """
+        Record one node heartbeat and pair the node with its partner if possible.
+        
+        Args:
+            request: Heartbeat request (or one entry of a batch_heartbeat)
+            client: Socket the heartbeat arrived on, used when no client_addr is given
             
-            elif command == 'init_accounts':
-                # Initialize accounts with initial balance
-                amount = request.get('amount', 10000)
-                success = True
+        Returns:
+            Response dict, or pre-encoded bytes for the plain acknowledgements
+        """
+        response = UNKNOWN_COMMAND_RESPONSE
+        reply_template = None  # Dict form of a canned response, copied if the reply gets pairing info
+        
+        node_id = request.get('node_id')
+        node_type = request.get('node_type')
+        port = request.get('port')
+        role_from_heartbeat = request.get('role', 'primary')  # Get role reported by node
+        backup_node = request.get('backup_node')
+        primary_node = request.get('primary_node')
+        client_addr = request.get('client_addr')  # Client address if provided through the request
+        
+        if node_type == 'account':
+            with self.lock:
+                # Only structural changes (membership, host, port, role, pairing) are persisted;
+                # a bare last_heartbeat refresh is not worth a full state write
+                structural = False
+                paired_primary = None
                 
-                # Only initialize primary nodes (backups will be synced automatically)
-                primary_nodes = {n: info for n, info in self.account_nodes.items() 
-                                if info.get('role', 'primary') == 'primary'}
+                # Record client address if provided; otherwise use connection address
+                if not client_addr:
+                    client_addr, _ = client.getpeername()
                 
-                for node_id, node_info in primary_nodes.items():
-                    try:
-                        host = self.node_hosts.get(node_id, 'localhost')
-                        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                            s.connect((host, node_info['port']))
-                            init_request = {
-                                'command': 'init_balance',
-                                'amount': amount
-                            }
-                            s.send(json.dumps(init_request).encode('utf-8'))
-                            init_response = json.loads(s.recv(4096).decode('utf-8'))
-                            
-                            if init_response.get('status') != 'success':
-                                success = False
-                                break
-                    
-                    except Exception as e:
-                        print(f"Failed to initialize account {node_id}: {e}")
-                        success = False
-                        break
+                # Store node host mapping
+                if self.node_hosts.get(node_id) != client_addr:
+                    self.node_hosts[node_id] = client_addr
+                    structural = True
                 
-                if success:
-                    response = {
-                        'status': 'success',
-                        'message': f'All accounts initialized with {amount}'
-                    }
+                # Check if node already exists
+                if node_id in self.account_nodes:
+                    # Node exists, update selectively
+                    existing_node_info = self.account_nodes[node_id]
+
+                    # If node is marked as failed, only update heartbeat time, do not change status/role
+                    if existing_node_info.get('status') == 'failed':
+                        log.info("Received heartbeat from failed node %s. Ignoring role/status update.", node_id)
+                        existing_node_info['last_heartbeat'] = time.time()
+                        # Optionally update port if it can change dynamically
+                        # existing_node_info['port'] = port
+                        response, reply_template = HEARTBEAT_FAILED_NODE_RESPONSE, HEARTBEAT_FAILED_NODE
+                    else:
+                        # Node is active, update normally but preserve existing status if any
+                        if existing_node_info.get('port') != port or existing_node_info.get('role') != role_from_heartbeat:
+                            structural = True
+                        existing_node_info['port'] = port
+                        existing_node_info['last_heartbeat'] = time.time()
+                        # Only update role if it's not explicitly set to something else by coordinator logic
+                        # For now, let's keep the role reported by the heartbeat unless coordinator logic changed it
+                        existing_node_info['role'] = role_from_heartbeat
+                        log.debug("Updated existing node %s info from heartbeat.", node_id)
+                        response, reply_template = HEARTBEAT_ACK_RESPONSE, HEARTBEAT_ACK
+                        # Re-evaluate pairing based on updated info if necessary (e.g., role changed)
+                        # This part might need refinement depending on role change handling
                 else:
+                    # New node, create entry
+                    self.account_nodes[node_id] = {
+                        'port': port,
+                        'last_heartbeat': time.time(),
+                        'role': role_from_heartbeat # Use role from heartbeat for new nodes
+                    }
+                    structural = True
+                    log.info("Registered new node %s from heartbeat.", node_id)
                     response = {
-                        'status': 'error',
-                        'message': 'Failed to initialize all accounts'
+                        'status': 'success',
+                        'message': 'Heartbeat received, new node registered'
                     }
+
+                # Handle primary-backup pairing regardless of new/existing if role is relevant
+                current_role = self.account_nodes[node_id]['role']
+
+                # If this is a primary node trying to pair
+                if current_role == 'primary' and not backup_node and node_id not in self.node_pairs:
+                    backup_id = f"{node_id}b"
+                    if backup_id in self.account_nodes and self.account_nodes[backup_id]['role'] == 'backup':
+                        self.pair_nodes(node_id, backup_id)
+                        structural = True
+                        if reply_template is not None:
+                            response = dict(reply_template)
+                        paired_primary = node_id
+                        response['backup_assigned'] = True
+                        response['backup_info'] = {'node_id': backup_id, 'port': self.account_nodes[backup_id]['port']}
+                        log.info("Paired primary %s with backup %s via heartbeat.", node_id, backup_id)
+
+                # If this is a backup node trying to pair
+                elif current_role == 'backup' and not primary_node and node_id not in self.backup_to_primary:
+                     if node_id.endswith('b') and len(node_id) > 1:
+                        primary_id = node_id[:-1]
+                        # Check if primary exists and is not already paired
+                        if primary_id in self.account_nodes and self.account_nodes[primary_id]['role'] == 'primary' and primary_id not in self.node_pairs:
+                            self.pair_nodes(primary_id, node_id)
+                            structural = True
+                            if reply_template is not None:
+                                response = dict(reply_template)
+                            paired_primary = primary_id
+                            response['primary_assigned'] = True
+                            response['primary_info'] = {'node_id': primary_id, 'port': self.account_nodes[primary_id]['port']}
+                            log.info("Paired backup %s with primary %s via heartbeat.", node_id, primary_id)
+
+                self.track_heartbeat(node_id)
+                if structural:
+                    self.log_node(node_id)
+                if paired_primary:
+                    self.log_pair(paired_primary)
+        
+        return response
+    
+    def encode_response(self, response):
+        """
+        Encode a response as a length-prefixed frame for sending to the client.
+        
+        Args:
+            response: Response dict, or already-framed bytes for canned responses
             
-            client.send(json.dumps(response).encode('utf-8'))
+        Returns:
+            The framed response bytes
+        """
+        if isinstance(response, bytes):
+            return response
+        return encode_msg(response)
+    
+    def init_account(self, node_id, amount):
+        """
+        Set the balance of a single primary account node.
+        
+        Args:
+            node_id: ID of the account node
+            amount: Initial balance
+            
+        Returns:
+            True if the node confirmed the new balance
+        """
+        try:
+            init_request = {
+                'command': 'init_balance',
+                'amount': amount
+            }
+            init_response = self.rpc(node_id, init_request)
+            return init_response.get('status') == 'success'
         
         except Exception as e:
-            print(f"Error handling request: {e}")
-        finally:
-            client.close()
+            log.error("Failed to initialize account %s: %s", node_id, e)
+            return False
+    
+    def checkout_connection(self, host, port):
+        """
+        Take an idle pooled connection to an account node, or open a new one.
+        
+        Args:
+            host: Host of the account node
+            port: Port of the account node
+            
+        Returns:
+            Tuple of (socket, whether it was reused from the pool)
+        """
+        with self.conn_pool_lock:
+            idle = self.conn_pool.setdefault((host, port), queue.LifoQueue())
+        try:
+            return idle.get_nowait(), True
+        except queue.Empty:
+            pass
+        
+        sock = socket.create_connection((host, port), timeout=self.rpc_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Let the kernel notice peers that vanished while the socket sat idle in the pool
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        return sock, False
+    
+    def checkin_connection(self, host, port, sock):
+        """
+        Return a healthy connection to the pool, closing it if the pool is full.
+        
+        Args:
+            host: Host of the account node
+            port: Port of the account node
+            sock: Socket to return
+        """
+        idle = self.conn_pool.get((host, port))
+        if idle is None or idle.qsize() >= self.max_idle_connections:
+            sock.close()
+            return
+        idle.put(sock)
+    
+    def rpc(self, node_id, request, timeout=None):
+        """
+        Send a request to an account node over a pooled connection and wait for the reply.
+        A pooled connection that turns out to be dead (e.g. the node restarted) is
+        discarded and the request is retried on a fresh connection, unless the request
+        may already have reached the node and resending it is not idempotent.
+        
+        Args:
+            node_id: ID of the account node
+            request: Request dict
+            timeout: Seconds to wait for the reply (defaults to rpc_timeout)
+            
+        Returns:
+            Response dict from the node
+        """
+        port = self.account_nodes[node_id]['port']
+        host = self.node_hosts.get(node_id, 'localhost')
+        
+        retry_after_send = request.get('command') in IDEMPOTENT_COMMANDS
+        while True:
+            sock, reused = self.checkout_connection(host, port)
+            sent = False
+            try:
+                sock.settimeout(timeout or self.rpc_timeout)
+                send_msg(sock, request)
+                sent = True
+                response = recv_msg(sock)
+                if response is None:
+                    raise ConnectionError(f"Node {node_id} closed the connection")
+            except socket.timeout:
+                # The node may still process the request, so never resend it
+                sock.close()
+                raise
+            except OSError:
+                sock.close()
+                # Once sent, the node may have applied the request before the connection died
+                if reused and (not sent or retry_after_send):
+                    continue
+                raise
+            except Exception:
+                sock.close()
+                raise
+            
+            self.checkin_connection(host, port, sock)
+            return response
     
     def execute_two_phase_commit(self, transaction_id, from_account, to_account, amount):
         # Phase 1: Preparation
         try:
             # Record the transaction
-            with self.lock:
+            with self.tx_lock:
                 self.transactions[transaction_id] = {
                     'status': 'preparing',
                     'from': from_account,
@@ -783,198 +1414,206 @@ class TransactionCoordinator:
                     'amount': amount,
                     'timestamp': time.time()
                 }
-                self.save_data()
+            # Status changes are logged after tx_lock is released, keeping the tx_lock critical section short
+            self.log_transaction(transaction_id)
             
-            # Prepare the sender
-            sender_ready = self.prepare_transfer(from_account, amount, True)
-            if not sender_ready:
-                with self.lock:
+            # Prepare the sender and the receiver in parallel
+            sender_future = self.rpc_pool.submit(self.prepare_transfer, from_account, amount, True)
+            receiver_future = self.rpc_pool.submit(self.prepare_transfer, to_account, amount, False)
+            sender_ready = sender_future.result()
+            receiver_ready = receiver_future.result()
+            if not (sender_ready and receiver_ready):
+                with self.tx_lock:
                     self.transactions[transaction_id]['status'] = 'aborted'
-                    self.save_data()
-                return False
-            
-            # Prepare the receiver
-            receiver_ready = self.prepare_transfer(to_account, amount, False)
-            if not receiver_ready:
-                with self.lock:
-                    self.transactions[transaction_id]['status'] = 'aborted'
-                    self.save_data()
+                self.log_transaction(transaction_id)
                 return False
             
             # Phase 2: Execution
             sender_success = self.execute_transfer(transaction_id, from_account, amount, True)
             if not sender_success:
-                with self.lock:
+                with self.tx_lock:
                     self.transactions[transaction_id]['status'] = 'failed'
-                    self.save_data()
+                self.log_transaction(transaction_id)
                 return False
             
             receiver_success = self.execute_transfer(transaction_id, to_account, amount, False)
             if not receiver_success:
                 # This is a critical failure state. Money has been deducted but not added.
                 # In a real system, this would require recovery mechanisms.
-                with self.lock:
+                with self.tx_lock:
                     self.transactions[transaction_id]['status'] = 'inconsistent'
-                    self.save_data()
-                print(f"CRITICAL ERROR: Transaction {transaction_id} in inconsistent state")
+                self.log_transaction(transaction_id)
+                log.critical("CRITICAL ERROR: Transaction %s in inconsistent state", transaction_id)
                 return False
             
             # Transaction completed successfully
-            with self.lock:
+            with self.tx_lock:
                 self.transactions[transaction_id]['status'] = 'completed'
-                self.save_data()
+            self.log_transaction(transaction_id)
             return True
         
         except Exception as e:
-            print(f"Error in two-phase commit: {e}")
-            with self.lock:
+            log.error("Error in two-phase commit: %s", e)
+            with self.tx_lock:
                 self.transactions[transaction_id]['status'] = 'error'
                 self.transactions[transaction_id]['error'] = str(e)
-                self.save_data()
+            self.log_transaction(transaction_id)
             return False
     
+    def takeover_node(self, account_id):
+        """
+        Find the node serving requests for a failed account: its paired backup,
+        or, once the pair was dissolved by a promotion, the backup named after it
+        that is now primary.
+        
+        Args:
+            account_id: ID of the failed account node
+            
+        Returns:
+            ID of the takeover node, or None if no node can take over
+        """
+        backup_id = self.node_pairs.get(account_id)
+        if backup_id and backup_id in self.account_nodes:
+            return backup_id
+        promoted_id = f"{account_id}b"
+        promoted_info = self.account_nodes.get(promoted_id)
+        if promoted_info is not None and promoted_info.get('role') == 'primary':
+            return promoted_id
+        return None
+    
+    def resolve_primary(self, account_id):
+        """
+        Resolve the node that should handle 2PC requests for an account.
+        Backup nodes are redirected to their paired primary via backup_to_primary.
+        A backup that has no registered pair (e.g. both nodes came up already
+        knowing each other) falls back to the naming convention.
+        
+        Args:
+            account_id: ID of the account node addressed by the request
+            
+        Returns:
+            Tuple of (resolved node ID, node info), node info is None if unresolvable
+        """
+        node_info = self.account_nodes.get(account_id)
+        if not node_info or node_info.get('role', 'primary') != 'backup':
+            return account_id, node_info
+        
+        primary_id = self.backup_to_primary.get(account_id)
+        if primary_id is None and account_id.endswith('b') and len(account_id) > 1:
+            primary_id = account_id[:-1]  # For backup node (e.g., a1b), its primary is a1
+        if primary_id is None or primary_id not in self.account_nodes:
+            log.error("Primary node for backup %s not found", account_id)
+            return account_id, None
+        return primary_id, self.account_nodes[primary_id]
+    
     def prepare_transfer(self, account_id, amount, is_sender):
         try:
-            # First ensure we only operate on primary nodes
-            node_info = self.account_nodes.get(account_id)
+            # Only operate on primary nodes; requests for a backup go to its primary
+            account_id, node_info = self.resolve_primary(account_id)
             if not node_info:
                 return False
             
-            # If this is a backup node, find its corresponding primary node
-            node_role = node_info.get('role', 'primary')
-            if node_role == 'backup':
-                # For backup node(e.g., a1b), find its corresponding primary node(a1)
-                if account_id.endswith('b') and len(account_id) > 1:
-                    primary_id = account_id[:-1]  # Remove 'b' suffix
-                    if primary_id in self.account_nodes:
-                        node_info = self.account_nodes[primary_id]
-                        account_id = primary_id
-                        print(f"Redirecting prepare request from backup {account_id}b to primary {account_id}")
-                    else:
-                        print(f"Error: Primary node for backup {account_id} not found")
-                        return False
-                else:
-                    print(f"Error: Backup node {account_id} has invalid format")
-                    return False
+            prepare_request = {
+                'command': 'prepare_transfer',
+                'amount': amount,
+                'is_sender': is_sender
+            }
+            prepare_response = self.rpc(account_id, prepare_request)
             
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                host = self.node_hosts.get(account_id, 'localhost')
-                s.connect((host, node_info['port']))
-                prepare_request = {
-                    'command': 'prepare_transfer',
-                    'amount': amount,
-                    'is_sender': is_sender
-                }
-                s.send(json.dumps(prepare_request).encode('utf-8'))
-                prepare_response = json.loads(s.recv(4096).decode('utf-8'))
-                
-                return prepare_response.get('status') == 'success'
+            return prepare_response.get('status') == 'success'
         
         except Exception as e:
-            print(f"Error preparing transfer for {account_id}: {e}")
+            log.error("Error preparing transfer for %s: %s", account_id, e)
             return False
     
     def execute_transfer(self, transaction_id, account_id, amount, is_sender):
         try:
-            # First ensure we only operate on primary nodes
-            node_info = self.account_nodes.get(account_id)
+            # Only operate on primary nodes; requests for a backup go to its primary
+            account_id, node_info = self.resolve_primary(account_id)
             if not node_info:
                 return False
             
-            # If this is a backup node, find its corresponding primary node
-            node_role = node_info.get('role', 'primary')
-            if node_role == 'backup':
-                # For backup node(e.g., a1b), find its corresponding primary node(a1)
-                if account_id.endswith('b') and len(account_id) > 1:
-                    primary_id = account_id[:-1]  # Remove 'b' suffix
-                    if primary_id in self.account_nodes:
-                        node_info = self.account_nodes[primary_id]
-                        account_id = primary_id
-                        print(f"Redirecting execute request from backup {account_id}b to primary {account_id}")
-                    else:
-                        print(f"Error: Primary node for backup {account_id} not found")
-                        return False
-                else:
-                    print(f"Error: Backup node {account_id} has invalid format")
-                    return False
+            execute_request = {
+                'command': 'execute_transfer',
+                'transaction_id': transaction_id,
+                'amount': amount,
+                'is_sender': is_sender
+            }
+            execute_response = self.rpc(account_id, execute_request)
             
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                host = self.node_hosts.get(account_id, 'localhost')
-                s.connect((host, node_info['port']))
-                execute_request = {
-                    'command': 'execute_transfer',
-                    'transaction_id': transaction_id,
-                    'amount': amount,
-                    'is_sender': is_sender
-                }
-                s.send(json.dumps(execute_request).encode('utf-8'))
-                execute_response = json.loads(s.recv(4096).decode('utf-8'))
-                
-                return execute_response.get('status') == 'success'
+            return execute_response.get('status') == 'success'
         
         except Exception as e:
-            print(f"Error executing transfer for {account_id}: {e}")
+            log.error("Error executing transfer for %s: %s", account_id, e)
             return False
     
     def monitor_nodes(self):
-        # Check node health periodically and handle failover
+        # Check node health and handle failover, waking when the earliest heartbeat deadline passes
+        wait_time = self.heartbeat_timeout  # Give nodes restored from disk one full timeout to heartbeat again
+        # load_data() already set monitor_wake while tracking the restored nodes
+        self.monitor_wake.clear()
         while True:
-            time.sleep(60)  # Check every 60 seconds
+            self.monitor_wake.wait(wait_time)
+            self.monitor_wake.clear()
             nodes_marked_failed_this_cycle = [] # Re-initialize the list here
+            promotions = []  # (backup_id, failed_primary_id), done after releasing self.lock as they call the backup
 
             with self.lock:
-                current_time = time.time()
+                current_time = time.monotonic()
                 
-                for node_id, node_info in list(self.account_nodes.items()):
-                    # Skip nodes already marked as failed
-                    if node_info.get('status') == 'failed':
+                # Only visit nodes whose deadline has passed instead of sweeping every node
+                while self.heartbeat_deadlines and self.heartbeat_deadlines[0][0] < current_time:
+                    _, node_id = heapq.heappop(self.heartbeat_deadlines)
+                    node_info = self.account_nodes.get(node_id)
+                    # Skip removed nodes and nodes already marked as failed
+                    if node_info is None or node_info.get('status') == 'failed':
                         continue
 
-                    # Check if node hasn't sent a heartbeat in 15 seconds
-                    heartbeat_timeout = 60 # <---- THIS IS THE VALUE TO CHANGE <--- Changed value from 15
-
-                    if node_info.get('last_heartbeat', 0) is None or (current_time - node_info.get('last_heartbeat', 0) > heartbeat_timeout):
-                        print(f"Node {node_id} has missed heartbeats. Last heartbeat at: {node_info.get('last_heartbeat', 'never')} Current time: {current_time}")
+                    # A node that heartbeated since this entry was pushed has a later entry in the heap
+                    heartbeat_age = current_time - self.heartbeat_seen.get(node_id, float('-inf'))
+                    if heartbeat_age > self.heartbeat_timeout:
+                        log.warning("Node %s has missed heartbeats. Last heartbeat at: %s (%.1f seconds ago)", node_id, node_info.get('last_heartbeat', 'never'), heartbeat_age)
                         
                         # Mark node as failed instead of removing immediately
                         self.account_nodes[node_id]['status'] = 'failed'
-                        self.account_nodes[node_id]['failure_time'] = current_time
+                        self.account_nodes[node_id]['failure_time'] = time.time()
                         nodes_marked_failed_this_cycle.append(node_id)
                         
                         # If primary node failed, promote its backup (but don't remove primary)
                         if node_info.get('role') == 'primary':
                             backup_id = self.node_pairs.get(node_id)
                             if backup_id and backup_id in self.account_nodes:
-                                print(f"Promoting backup {backup_id} for failed primary {node_id}")
+                                log.info("Promoting backup %s for failed primary %s", backup_id, node_id)
                                 # Promote backup but DO NOT remove the primary node record or the pair yet.
                                 # The primary is kept as 'failed'. The pair removal can happen 
                                 # during recovery or if backup promotion fails and needs cleanup.
-                                promote_success = self.promote_backup_to_primary(backup_id, node_id)
-                                if not promote_success:
-                                     print(f"Warning: Failed to promote backup {backup_id}. State might be inconsistent.")
-                                # Keep the node_pairs entry for now, maybe useful for recovery?
-                                # Let's stick to removing it in promote_backup_to_primary for consistency.
+                                promotions.append((backup_id, node_id))
                         # If a backup node fails, just mark it as failed. 
                         # The primary might need to find a new backup later.
                         elif node_info.get('role') == 'backup':
-                             print(f"Backup node {node_id} marked as failed.")
-                             # Find its primary and maybe remove the pairing if necessary, 
-                             # but let's keep it simple for now and just mark failed.
-                             # for primary_id, current_backup_id in list(self.node_pairs.items()):
-                             #    if current_backup_id == node_id:
-                             #        self.node_pairs.pop(primary_id)
-                             #        print(f"Removed pairing for failed backup {node_id} of primary {primary_id}")
-                             #        break
+                             log.info("Backup node %s marked as failed.", node_id)
+                             # Its primary is self.backup_to_primary.get(node_id) if the pairing
+                             # ever needs removing, but let's keep it simple for now and just mark failed.
 
-                # Save data if any nodes were marked as failed
-                if nodes_marked_failed_this_cycle:
-                    self.save_data()
+                # Log every node marked as failed this cycle
+                for node_id in nodes_marked_failed_this_cycle:
+                    self.log_node(node_id)
+                
+                wait_time = self.next_monitor_wait()
+            
+            # Several primaries can time out in the same pass; notify their backups concurrently
+            # promote_backup_to_primary removes the node_pairs entry for consistency
+            futures = {self.rpc_pool.submit(self.promote_backup_to_primary, backup_id, node_id): backup_id
+                       for backup_id, node_id in promotions}
+            for future, backup_id in futures.items():
+                if not future.result():
+                     log.warning("Failed to promote backup %s. State might be inconsistent.", backup_id)
             
     def promote_backup_to_primary(self, backup_id, failed_primary_id):
         """Promote backup node to primary"""
         # First check if backup node exists
         if backup_id not in self.account_nodes:
-            print(f"Cannot promote node {backup_id}: Node does not exist")
+            log.warning("Cannot promote node %s: Node does not exist", backup_id)
             return False
         
         # 1. Update coordinator internal state (this step should never fail)
@@ -984,57 +1623,93 @@ class TransactionCoordinator:
                 self.account_nodes[backup_id]['role'] = 'primary'
                 
                 # Remove primary-backup relationship
-                self.node_pairs.pop(failed_primary_id, None)
+                self.unpair_node(failed_primary_id)
                 
-                # Save updated state
-                self.save_data()
+                # Log updated state
+                self.log_node(backup_id)
+                self.log_pair(failed_primary_id)
                 
-            print(f"Coordinator has updated node {backup_id} role to primary")
+            log.info("Coordinator has updated node %s role to primary", backup_id)
         except Exception as e:
-            print(f"Error updating coordinator internal state: {e}")
+            log.error("Error updating coordinator internal state: %s", e)
             return False
         
-        # 2. Try to notify backup node, but even if it fails, do not affect state update
-        success = False
-        try:
-            backup_port = self.account_nodes[backup_id]['port']
-            host = self.node_hosts.get(backup_id, 'localhost')
-            
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(2)  # Short timeout, avoid long blocking
-                s.connect((host, backup_port))
-                promote_request = {
-                    'command': 'become_primary'
-                }
-                s.send(json.dumps(promote_request).encode('utf-8'))
-                
-                # Try to get response but do not depend on it
-                try:
-                    response_data = s.recv(4096)
-                    promote_response = json.loads(response_data.decode('utf-8'))
-                    success = promote_response.get('status') == 'success'
-                    
-                    if success:
-                        print(f"Backup node {backup_id} confirmed receiving command to become primary")
-                    else:
-                        print(f"Backup node {backup_id} returned error: {promote_response.get('message')}")
-                except Exception as e:
-                    print(f"Error reading backup node response: {e}")
-        except Exception as e:
-            print(f"Error sending promote notification to backup node {backup_id}: {e}")
+        # 2. Notify the backup node in the background; the caller does not wait for its reply
+        self.send_promotion_notice(backup_id)
         
         # Regardless of notification success, state is updated, so return success
         return True
+    
+    def send_promotion_notice(self, backup_id):
+        """
+        Tell a promoted backup node to become primary without waiting for its reply.
+        
+        Args:
+            backup_id: ID of the backup node that was promoted
+            
+        Returns:
+            Future resolving to True if the node confirmed the promotion
+        """
+        def forget(done):
+            with self.lock:
+                if self.promotion_notices.get(backup_id) is done:
+                    del self.promotion_notices[backup_id]
+        
+        notice = self.rpc_pool.submit(self.notify_promotion, backup_id)
+        with self.lock:
+            self.promotion_notices[backup_id] = notice
+        notice.add_done_callback(forget)
+        return notice
+    
+    def notify_promotion(self, backup_id):
+        """
+        Send become_primary to a promoted backup node and log its reply.
+        
+        Args:
+            backup_id: ID of the backup node that was promoted
+            
+        Returns:
+            True if the node confirmed the promotion, False otherwise
+        """
+        try:
+            # Short timeout, avoid long blocking; the response is logged but not depended on
+            promote_response = self.rpc(backup_id, {'command': 'become_primary'}, timeout=2)
+        except Exception as e:
+            log.error("Error sending promote notification to backup node %s: %s", backup_id, e)
+            return False
+        
+        if promote_response.get('status') == 'success':
+            log.info("Backup node %s confirmed receiving command to become primary", backup_id)
+            return True
+        log.warning("Backup node %s returned error: %s", backup_id, promote_response.get('message'))
+        return False
 
 if __name__ == "__main__":
     import sys
     
+    # Progress goes to the console as before; the rotating file keeps a bounded history
+    os.makedirs("data", exist_ok=True)
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter("%(message)s"))
+    file_handler = RotatingFileHandler("data/coordinator.log", maxBytes=5 << 20, backupCount=3)
+    file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(threadName)s %(message)s"))
+    # Request threads only enqueue records; the listener thread does the console and file writes
+    log_queue = queue.SimpleQueue()
+    log_listener = QueueListener(log_queue, console_handler, file_handler)
+    logging.basicConfig(level=logging.INFO, format="%(message)s", handlers=[QueueHandler(log_queue)])
+    log_listener.start()
+    
     port = int(sys.argv[1]) if len(sys.argv) > 1 else COORDINATOR_PORT
     
     coordinator = TransactionCoordinator(port)
     
+    # Block until SIGINT/SIGTERM instead of waking every second to poll for KeyboardInterrupt
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
     try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print("Transaction Coordinator shutting down...")
+        stop.wait()
+        log.info("Transaction Coordinator shutting down...")
+        coordinator.shutdown()
+    finally:
+        log_listener.stop()  # Flushes records still in the queue
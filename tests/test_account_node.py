@@ -12,6 +12,7 @@ if root_dir not in sys.path:
     sys.path.insert(0, root_dir)
 
 from src.account_node import AccountNode
+from src.protocol import encode_msg
 
 class TestAccountNode(unittest.TestCase):
 
@@ -347,5 +348,26 @@ class TestAccountNode(unittest.TestCase):
         self.assertEqual(self.node.role, 'backup') # 角色不变
 
 
+    def test_handle_request_serves_multiple_frames(self):
+        """测试同一连接上连续处理多个带长度前缀的请求"""
+        self.node.balance = 100
+        buffer = bytearray(encode_msg({'command': 'get_balance'}) + encode_msg({'command': 'heartbeat'}))
+
+        def fake_recv_into(view):
+            chunk = buffer[:min(len(view), 3)] # 每次最多返回 3 字节，模拟分片到达
+            view[:len(chunk)] = chunk
+            del buffer[:len(chunk)]
+            return len(chunk)
+
+        mock_client = MagicMock()
+        mock_client.recv_into.side_effect = fake_recv_into
+        self.node.handle_request(mock_client)
+
+        responses = [json.loads(call.args[0][4:]) for call in mock_client.sendall.call_args_list]
+        self.assertEqual(len(responses), 2)
+        self.assertEqual(responses[0]['balance'], 100)
+        self.assertEqual(responses[1]['node_id'], 'a1')
+        mock_client.close.assert_called_once()
+
 if __name__ == '__main__':
     unittest.main(argv=['first-arg-is-ignored'], exit=False) 
\ No newline at end of file
@@ -4,6 +4,11 @@ import time
 import sys
 import os
 import json
+import queue
+import struct
+import tempfile
+import threading
+from concurrent.futures import Future
 
 # 确保 src 和 config 目录在 PYTHONPATH 中
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -12,7 +17,9 @@ if root_dir not in sys.path:
     sys.path.insert(0, root_dir)
 
 # 假设 Coordinator 依赖这些
-from src.transaction_coordinator import TransactionCoordinator
+from src.transaction_coordinator import (TransactionCoordinator, UNKNOWN_COMMAND_RESPONSE,
+                                         HEARTBEAT_ACK_RESPONSE, HEARTBEAT_FAILED_NODE_RESPONSE)
+from src.protocol import encode_msg, scratch_buffer, MAX_FRAME_SIZE
 # 如果 TransactionCoordinator 直接导入 config, 可能需要 mock config
 # from config.network_config import COORDINATOR_PORT # 或者 mock 它
 
@@ -323,6 +330,128 @@ class TestTransactionCoordinator(unittest.TestCase):
         # save_data 会被调用（标记 a1 失败 + promote_backup 内部调用）
         self.assertGreaterEqual(self.coordinator.save_data.call_count, 1)
 
+    def test_monitor_nodes_checks_only_expired_deadlines(self):
+        """测试超时检测只处理到期的心跳截止时间，期间又发过心跳的节点不会被标记失败"""
+        self.coordinator.log_node = MagicMock()
+        self.coordinator.account_nodes = {
+            'a1': {'port': 6001, 'role': 'primary', 'last_heartbeat': 900.0},
+            'a2': {'port': 6002, 'role': 'primary', 'last_heartbeat': 900.0},
+            'a3': {'port': 6003, 'role': 'primary', 'last_heartbeat': 990.0},
+        }
+        for node_id in ('a1', 'a2', 'a3'):
+            self.coordinator.track_heartbeat(node_id, self.coordinator.account_nodes[node_id]['last_heartbeat'])
+        self.coordinator.account_nodes['a2']['last_heartbeat'] = 995.0 # 旧截止时间已过期但节点仍然活跃
+        self.coordinator.track_heartbeat('a2', 995.0)
+
+        self.coordinator.monitor_wake = MagicMock()
+        self.coordinator.monitor_wake.wait.side_effect = [None, StopIteration]
+        # 超时按单调时钟计算，系统时间向前跳变不会把活跃节点判为失败
+        with patch('src.transaction_coordinator.time.monotonic', return_value=1000.0), \
+             patch('src.transaction_coordinator.time.time', return_value=1000.0 + 86400):
+            with self.assertRaises(StopIteration):
+                self.coordinator.monitor_nodes()
+
+        self.assertEqual(self.coordinator.account_nodes['a1']['status'], 'failed')
+        self.assertNotIn('status', self.coordinator.account_nodes['a2'])
+        self.assertNotIn('status', self.coordinator.account_nodes['a3'])
+        self.coordinator.log_node.assert_called_once_with('a1')
+        self.assertEqual(sorted(n for _, n in self.coordinator.heartbeat_deadlines), ['a2', 'a3'])
+        # 下一次检查等到最早的截止时间（a3: 990 + 60）
+        self.assertEqual(self.coordinator.monitor_wake.wait.call_args.args[0], 50.0)
+
+    def test_restart_gives_restored_nodes_full_timeout(self):
+        """测试从过期快照重启后，恢复的节点在 heartbeat_timeout 内不会被判为失败"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.coordinator.data_file = os.path.join(tmp_dir, 'coordinator_data.json')
+            self.coordinator.wal_file = os.path.join(tmp_dir, 'wal.log')
+            with open(self.coordinator.data_file, 'w') as f:
+                stale = time.time() - 3600
+                json.dump({'account_nodes': {'a1': {'port': 6001, 'role': 'primary', 'last_heartbeat': stale},
+                                             'a1b': {'port': 6002, 'role': 'backup', 'last_heartbeat': stale}},
+                           'node_pairs': {'a1': 'a1b'}}, f)
+            self.coordinator.heartbeat_deadlines = []
+            self.coordinator.monitor_wake = threading.Event()
+            TransactionCoordinator.load_data(self.coordinator)
+        self.coordinator.log_node = MagicMock()
+
+        # 被唤醒时立即返回，否则把时钟拨到超时之后；第二次等待时结束监控循环
+        clock = [time.monotonic()]
+        start = clock[0]
+        waits = []
+        def fake_wait(timeout):
+            waits.append(clock[0] - start)
+            if len(waits) > 1:
+                raise StopIteration
+            if self.coordinator.monitor_wake.is_set():
+                return True
+            clock[0] += timeout
+            return False
+        self.coordinator.monitor_wake.wait = fake_wait
+        with patch('src.transaction_coordinator.time.monotonic', side_effect=lambda: clock[0]):
+            with self.assertRaises(StopIteration):
+                self.coordinator.monitor_nodes()
+
+        # 第一次检查发生在完整的超时之后
+        self.assertGreaterEqual(waits[1], self.coordinator.heartbeat_timeout)
+
+    def test_load_data_schedules_restored_deadlines_from_now(self):
+        """测试恢复的节点保留原有的心跳间隔，但截止时间从加载时起算一个完整超时"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.coordinator.data_file = os.path.join(tmp_dir, 'coordinator_data.json')
+            self.coordinator.wal_file = os.path.join(tmp_dir, 'wal.log')
+            with open(self.coordinator.data_file, 'w') as f:
+                json.dump({'account_nodes': {'a1': {'port': 6001, 'role': 'primary', 'last_heartbeat': time.time() - 3600},
+                                             'a2': {'port': 6003, 'role': 'primary', 'last_heartbeat': time.time()}}}, f)
+            self.coordinator.heartbeat_deadlines = []
+            loaded_at = time.monotonic()
+            TransactionCoordinator.load_data(self.coordinator)
+
+        self.assertEqual(sorted(n for _, n in self.coordinator.heartbeat_deadlines), ['a1', 'a2'])
+        for deadline, _ in self.coordinator.heartbeat_deadlines:
+            self.assertGreaterEqual(deadline, loaded_at + self.coordinator.heartbeat_timeout)
+        self.assertGreater(self.coordinator.heartbeat_age('a1'), 3500)
+        self.assertLess(self.coordinator.heartbeat_age('a2'), 60)
+
+    def test_monitor_nodes_promotes_backups_concurrently(self):
+        """测试同一轮检测到多个主节点失败时，各备份节点的提升通知并发发送"""
+        self.coordinator.log_node = MagicMock()
+        self.coordinator.account_nodes = {
+            'a1': {'port': 6001, 'role': 'primary'}, 'a1b': {'port': 6002, 'role': 'backup'},
+            'a2': {'port': 6003, 'role': 'primary'}, 'a2b': {'port': 6004, 'role': 'backup'},
+        }
+        self.coordinator.node_pairs = {'a1': 'a1b', 'a2': 'a2b'}
+        for node_id in ('a1', 'a2'):
+            self.coordinator.track_heartbeat(node_id, 900.0)
+        # 两个提升都在进行中 Barrier 才会放行，串行执行会超时
+        barrier = threading.Barrier(2, timeout=2)
+        def fake_promote(backup_id, failed_primary_id):
+            barrier.wait()
+            return True
+        self.coordinator.promote_backup_to_primary = MagicMock(side_effect=fake_promote)
+
+        self.coordinator.monitor_wake = MagicMock()
+        self.coordinator.monitor_wake.wait.side_effect = [None, StopIteration]
+        with patch('src.transaction_coordinator.time.monotonic', return_value=1000.0):
+            with self.assertRaises(StopIteration):
+                self.coordinator.monitor_nodes()
+
+        self.assertFalse(barrier.broken)
+        self.assertEqual(sorted(call.args for call in self.coordinator.promote_backup_to_primary.call_args_list),
+                         [('a1b', 'a1'), ('a2b', 'a2')])
+
+    def test_track_heartbeat_wakes_idle_monitor(self):
+        """测试截止时间堆从空变为非空时唤醒监控线程，之后的心跳不再唤醒"""
+        self.coordinator.heartbeat_deadlines = []
+        self.coordinator.monitor_wake.clear()
+        self.coordinator.account_nodes = {'a1': {'port': 6001, 'role': 'primary', 'last_heartbeat': 1000.0}}
+
+        self.coordinator.track_heartbeat('a1')
+        self.assertTrue(self.coordinator.monitor_wake.is_set())
+
+        self.coordinator.monitor_wake.clear()
+        self.coordinator.track_heartbeat('a1')
+        self.assertFalse(self.coordinator.monitor_wake.is_set())
+
     def test_transfer_command_triggers_2pc(self):
         """测试 transfer 命令是否触发两阶段提交"""
         self._simulate_heartbeat('a1', 6001, 'primary')
@@ -355,13 +484,480 @@ class TestTransactionCoordinator(unittest.TestCase):
         self.assertEqual(response['status'], 'success') # 基于 mock 的返回值
         self.assertEqual(response['message'], 'Mock 2PC success')
 
-    # TODO: 添加更多测试用例
-    # - 测试 recover_node 命令
-    # - 测试 check_node_status 命令
-    # - 测试 handle_request 对无效命令的处理
-    # - 测试 _send_request_to_node 的异常处理 (需要更复杂的 mock)
-    # - 测试 execute_two_phase_commit 的内部逻辑 (可能需要单独的测试类或更精细的 mock)
-    # - 测试 primary-backup 配对逻辑 (心跳处理部分)
+    def test_encode_response(self):
+        """测试响应编码：预先分帧的字节直接返回，字典加上 4 字节长度前缀"""
+        self.assertIs(self.coordinator.encode_response(UNKNOWN_COMMAND_RESPONSE), UNKNOWN_COMMAND_RESPONSE)
+        self.assertEqual(int.from_bytes(UNKNOWN_COMMAND_RESPONSE[:4], 'big'), len(UNKNOWN_COMMAND_RESPONSE) - 4)
+        encoded = self.coordinator.encode_response({'status': 'success'})
+        self.assertEqual(json.loads(encoded[4:].decode('utf-8')), {'status': 'success'})
+
+    def _feed(self, data):
+        """辅助方法：返回一个按 recv_into 语义依次吐出 data 的假函数"""
+        pending = bytearray(data)
+        def fake_recv_into(view):
+            chunk = pending[:len(view)]
+            view[:len(chunk)] = chunk
+            del pending[:len(chunk)]
+            return len(chunk)
+        return fake_recv_into
+
+    def _handle_framed_request(self, request):
+        """辅助方法：把一条带长度前缀的请求交给真实的 handle_request，返回解码后的响应"""
+        client = MagicMock()
+        client.recv_into.side_effect = self._feed(encode_msg(request))
+        self.coordinator.handle_request(client)
+        return json.loads(client.sendall.call_args.args[0][4:])
+
+    def test_heartbeat_refresh_is_not_persisted(self):
+        """测试只刷新 last_heartbeat 的心跳不写磁盘，只有首次注册会记录节点"""
+        self.coordinator.log_node = MagicMock()
+        self.coordinator.log_pair = MagicMock()
+        heartbeat = {'command': 'heartbeat', 'node_id': 'a1', 'node_type': 'account',
+                     'port': 6001, 'role': 'primary', 'client_addr': '127.0.0.1'}
+
+        self._handle_framed_request(heartbeat)
+        self.coordinator.log_node.assert_called_once_with('a1')
+        first_seen = self.coordinator.account_nodes['a1']['last_heartbeat']
+
+        client = MagicMock()
+        client.recv_into.side_effect = self._feed(encode_msg(heartbeat))
+        self.coordinator.handle_request(client)
+        # 普通心跳直接发送预先编码好的确认
+        client.sendall.assert_called_once_with(HEARTBEAT_ACK_RESPONSE)
+        self.coordinator.log_node.assert_called_once_with('a1')
+        self.coordinator.log_pair.assert_not_called()
+        self.coordinator.save_data.assert_not_called()
+        self.assertGreaterEqual(self.coordinator.account_nodes['a1']['last_heartbeat'], first_seen)
+
+    def test_failed_node_heartbeat_uses_canned_reply(self):
+        """测试已标记失败节点的普通心跳直接发送预先编码的回复，需要附带配对信息时才构造字典"""
+        self.coordinator.log_node = MagicMock()
+        self.coordinator.log_pair = MagicMock()
+        self.coordinator.node_hosts = {'a1': '127.0.0.1', 'a2b': '127.0.0.1'}
+        self.coordinator.account_nodes = {'a1': {'port': 6001, 'role': 'primary', 'status': 'failed'},
+                                          'a2': {'port': 6003, 'role': 'primary'},
+                                          'a2b': {'port': 6004, 'role': 'backup', 'status': 'failed'}}
+        self.coordinator.node_pairs = {'a1': 'a1b'}
+        heartbeat = {'command': 'heartbeat', 'node_type': 'account', 'client_addr': '127.0.0.1'}
+
+        client = MagicMock()
+        client.recv_into.side_effect = self._feed(encode_msg(dict(heartbeat, node_id='a1', port=6001, role='primary')))
+        self.coordinator.handle_request(client)
+        client.sendall.assert_called_once_with(HEARTBEAT_FAILED_NODE_RESPONSE)
+
+        response = self._handle_framed_request(dict(heartbeat, node_id='a2b', port=6004, role='backup'))
+        self.assertEqual(response['message'], 'Heartbeat received from failed node, status unchanged')
+        self.assertTrue(response['primary_assigned'])
+        self.assertEqual(response['primary_info'], {'node_id': 'a2', 'port': 6003})
+
+    def test_bad_frame_length_closes_connection(self):
+        """测试长度为 0 或超过上限的帧不分配缓冲区、不回复，直接关闭连接"""
+        for size in (0, MAX_FRAME_SIZE + 1, 0xFFFFFFFF):
+            client = MagicMock()
+            client.recv_into.side_effect = self._feed(struct.pack('>I', size) + b'{}')
+            with patch('src.protocol.scratch_buffer', wraps=scratch_buffer) as buffers:
+                self.coordinator.handle_request(client)
+            self.assertEqual([call.args[0] for call in buffers.call_args_list], [4])
+            client.sendall.assert_not_called()
+            client.close.assert_called_once()
+
+    def test_unknown_command_returns_error(self):
+        """测试分发表中没有的命令返回未知命令错误"""
+        response = self._handle_framed_request({'command': 'no_such_command'})
+        self.assertEqual(response, {'status': 'error', 'message': 'Unknown command'})
+
+    def test_batch_heartbeat_registers_and_pairs_nodes(self):
+        """测试批量心跳一次登记多个节点，并返回其中产生的配对信息"""
+        self.coordinator.wal_size = 0
+        entries = [{'node_id': node_id, 'node_type': 'account', 'port': port, 'role': role, 'client_addr': '127.0.0.1'}
+                   for node_id, port, role in (('a1', 6001, 'primary'), ('a1b', 6002, 'backup'), ('a2', 6003, 'primary'))]
+
+        response = self._handle_framed_request({'command': 'batch_heartbeat', 'entries': entries})
+
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(response['count'], 3)
+        self.assertEqual([p['node_id'] for p in response['pairings']], ['a1b'])
+        self.assertEqual(response['pairings'][0]['primary_info'], {'node_id': 'a1', 'port': 6001})
+        self.assertCountEqual(self.coordinator.account_nodes, ['a1', 'a1b', 'a2'])
+        self.assertEqual(self.coordinator.node_pairs, {'a1': 'a1b'})
+
+    def test_resolve_primary_redirects_backup(self):
+        """测试心跳配对时填好路由表，2PC 请求发往备份节点时被路由到其主节点"""
+        self.coordinator.wal_size = 0
+        for node_id, port, role in (('a1', 6001, 'primary'), ('a1b', 6002, 'backup')):
+            self._handle_framed_request({'command': 'heartbeat', 'node_id': node_id, 'node_type': 'account',
+                                         'port': port, 'role': role, 'client_addr': '127.0.0.1'})
+        self.assertEqual(self.coordinator.node_pairs, {'a1': 'a1b'})
+        self.assertEqual(self.coordinator.backup_to_primary, {'a1b': 'a1'})
+
+        node_id, node_info = self.coordinator.resolve_primary('a1b')
+        self.assertEqual(node_id, 'a1')
+        self.assertEqual(node_info['port'], 6001)
+        # 主节点直接返回自身
+        self.assertEqual(self.coordinator.resolve_primary('a1')[0], 'a1')
+        # 未知节点无法解析
+        self.assertIsNone(self.coordinator.resolve_primary('zz')[1])
+
+    def test_report_node_failure_checks_reverse_pair_index(self):
+        """测试故障报告通过反向索引校验报告者确实是失败节点的备份"""
+        self.coordinator.wal_size = 0
+        for node_id, port, role in (('a1', 6001, 'primary'), ('a1b', 6002, 'backup'), ('a2', 6003, 'primary')):
+            self._handle_framed_request({'command': 'heartbeat', 'node_id': node_id, 'node_type': 'account',
+                                         'port': port, 'role': role, 'client_addr': '127.0.0.1'})
+        self.assertEqual(self.coordinator.backup_to_primary, {'a1b': 'a1'})
+
+        report = {'command': 'report_node_failure', 'reporter_role': 'backup', 'failed_node': 'a1'}
+        response = self._handle_framed_request(dict(report, reporter='a2'))
+        self.assertEqual(response['status'], 'error')
+        response = self._handle_framed_request(dict(report, reporter='a1b'))
+        self.assertTrue(response['retry']) # 心跳刚刚收到，暂缓处理
+
+        with self.coordinator.lock:
+            self.coordinator.unpair_node('a1')
+        self.assertEqual(self.coordinator.node_pairs, {})
+        self.assertEqual(self.coordinator.backup_to_primary, {})
+
+    def test_load_data_rebuilds_routing_table(self):
+        """测试从快照恢复配对关系时重建备份到主节点的路由表"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.coordinator.data_file = os.path.join(tmp_dir, 'coordinator_data.json')
+            self.coordinator.wal_file = os.path.join(tmp_dir, 'wal.log')
+            with open(self.coordinator.data_file, 'w') as f:
+                json.dump({'account_nodes': {'a1': {'port': 6001, 'role': 'primary'}, 'a1b': {'port': 6002, 'role': 'backup'}},
+                           'node_pairs': {'a1': 'a1b'}}, f)
+            TransactionCoordinator.load_data(self.coordinator)
+
+        self.assertEqual(self.coordinator.backup_to_primary, {'a1b': 'a1'})
+
+    def test_resolve_primary_falls_back_for_unpaired_backup(self):
+        """测试没有登记配对的备份节点按命名约定路由到主节点，且不缓存；解除配对后不再路由到原主节点"""
+        self.coordinator.account_nodes = {'a1': {'port': 6001, 'role': 'primary'}, 'a1b': {'port': 6002, 'role': 'backup'},
+                                          'x1': {'port': 6003, 'role': 'primary'}, 'spare': {'port': 6004, 'role': 'backup'}}
+
+        self.assertEqual(self.coordinator.resolve_primary('a1b')[0], 'a1')
+        self.assertEqual(self.coordinator.backup_to_primary, {})
+
+        with self.coordinator.lock:
+            self.coordinator.pair_nodes('x1', 'spare')
+        self.assertEqual(self.coordinator.resolve_primary('spare')[0], 'x1')
+        with self.coordinator.lock:
+            self.coordinator.unpair_node('x1')
+        self.assertIsNone(self.coordinator.resolve_primary('spare')[1])
+
+    def test_finished_transactions_are_archived_beyond_cap(self):
+        """测试超过上限的已结束事务被移入归档文件，并记录删除以免重放时恢复；不一致的事务保留"""
+        self.coordinator.max_finished_transactions = 2
+        self.coordinator.wal = MagicMock()
+        self.coordinator.archive = MagicMock()
+        self.coordinator.wal_size = 0
+        for tx_id, status in (('t1', 'completed'), ('t2', 'inconsistent'), ('t3', 'aborted'), ('t4', 'completed')):
+            self.coordinator.transactions[tx_id] = {'status': status}
+            self.coordinator.log_transaction(tx_id)
+
+        self.assertEqual(list(self.coordinator.transactions), ['t2', 't3', 't4'])
+        archived = [json.loads(line) for line in self.coordinator.archive.write.call_args.args[0].splitlines()]
+        self.assertEqual(archived, [{'status': 'completed', 'transaction_id': 't1'}])
+
+        # 按日志重放得到同样的事务集合
+        self.coordinator.transactions = {}
+        for call in self.coordinator.wal.write.call_args_list:
+            self.coordinator.apply_wal_entry(json.loads(call.args[0]))
+        self.assertEqual(list(self.coordinator.transactions), ['t2', 't3', 't4'])
+
+    def test_replay_wal(self):
+        """测试从预写日志恢复状态（后写入的记录覆盖先前状态，残缺的末行被忽略）"""
+        records = [
+            {'op': 'node', 'node_id': 'a1', 'info': {'port': 6001, 'role': 'primary'}, 'host': '10.0.0.1'},
+            {'op': 'pair', 'primary_id': 'a1', 'backup_id': 'a1b'},
+            {'op': 'txn', 'transaction_id': 't1', 'record': {'status': 'preparing'}},
+            {'op': 'txn', 'transaction_id': 't1', 'record': {'status': 'completed'}},
+            {'op': 'pair', 'primary_id': 'a2', 'backup_id': 'a2b'},
+            {'op': 'pair', 'primary_id': 'a2', 'backup_id': None},
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            wal_file = os.path.join(tmp_dir, 'wal.log')
+            with open(wal_file, 'wb') as f:
+                for record in records:
+                    f.write(json.dumps(record).encode('utf-8') + b'\n')
+                f.write(b'{"op": "txn", "transaction_id": "t2", "rec')
+            self.coordinator.wal_file = wal_file
+            self.coordinator.replay_wal()
+
+        self.assertEqual(self.coordinator.transactions, {'t1': {'status': 'completed'}})
+        self.assertEqual(self.coordinator.account_nodes['a1']['port'], 6001)
+        self.assertEqual(self.coordinator.node_hosts['a1'], '10.0.0.1')
+        self.assertEqual(self.coordinator.node_pairs, {'a1': 'a1b'})
+
+    def test_replay_wal_truncates_torn_tail(self):
+        """测试重放后截掉残缺的末行，之后追加的记录在下次重放时不会丢失"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            wal_file = os.path.join(tmp_dir, 'wal.log')
+            with open(wal_file, 'wb') as f:
+                f.write(b'{"op": "txn", "transaction_id": "t1", "record": {"status": "completed"}}\n')
+                f.write(b'{"op": "txn", "transaction_id": "t2", "rec')
+            self.coordinator.wal_file = wal_file
+            self.coordinator.replay_wal()
+            with open(wal_file, 'ab') as f:
+                f.write(b'{"op": "txn", "transaction_id": "t3", "record": {"status": "preparing"}}\n')
+
+            self.coordinator.transactions = {}
+            self.coordinator.replay_wal()
+
+        self.assertEqual(set(self.coordinator.transactions), {'t1', 't3'})
+
+    def test_save_data_replaces_snapshot_atomically(self):
+        """测试快照先写临时文件再原子替换，写入失败时保留旧快照和预写日志"""
+        self.coordinator.transactions = {'t1': {'status': 'completed'}}
+        self.coordinator.wal = MagicMock()
+        self.coordinator.wal_size = 10
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.coordinator.data_file = os.path.join(tmp_dir, 'coordinator_data.json')
+            with open(self.coordinator.data_file, 'w') as f:
+                f.write('{"transactions": {"t0": {"status": "completed"}}}')
+
+            with patch('src.transaction_coordinator.os.replace', side_effect=OSError('disk full')):
+                TransactionCoordinator.save_data(self.coordinator)
+            with open(self.coordinator.data_file) as f:
+                self.assertIn('t0', json.load(f)['transactions'])
+            self.coordinator.wal.truncate.assert_not_called()
+
+            TransactionCoordinator.save_data(self.coordinator)
+            with open(self.coordinator.data_file) as f:
+                self.assertEqual(json.load(f)['transactions'], {'t1': {'status': 'completed'}})
+            self.assertFalse(os.path.exists(self.coordinator.data_file + '.tmp'))
+        self.coordinator.wal.truncate.assert_called_once_with(0)
+
+    def test_save_data_keeps_records_logged_during_write(self):
+        """测试快照在锁外写入时，期间追加的日志记录被保留，之前的记录被丢弃"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.coordinator.data_file = os.path.join(tmp_dir, 'coordinator_data.json')
+            self.coordinator.wal_file = os.path.join(tmp_dir, 'wal.log')
+            self.coordinator.wal = open(self.coordinator.wal_file, 'ab', buffering=0)
+            self.coordinator.wal_size = 0
+            self.coordinator.transactions = {'t1': {'status': 'completed'}}
+            self.coordinator.log_transaction('t1')
+
+            original_write_snapshot = TransactionCoordinator.write_snapshot
+            def write_snapshot_while_logging(data, logged):
+                # 写快照期间锁已释放，其他请求可以继续修改状态并写日志
+                with self.coordinator.tx_lock:
+                    self.coordinator.transactions['t2'] = {'status': 'preparing'}
+                self.coordinator.log_transaction('t2')
+                original_write_snapshot(self.coordinator, data, logged)
+            self.coordinator.write_snapshot = write_snapshot_while_logging
+            TransactionCoordinator.save_data(self.coordinator)
+
+            with open(self.coordinator.data_file) as f:
+                self.assertEqual(json.load(f)['transactions'], {'t1': {'status': 'completed'}})
+            with open(self.coordinator.wal_file, 'rb') as f:
+                self.assertEqual([json.loads(line)['transaction_id'] for line in f], ['t2'])
+            self.coordinator.wal.close()
+
+    def test_rpc_retries_stale_pooled_connection(self):
+        """测试连接池中的失效连接被丢弃并在新连接上重试"""
+        self.coordinator.account_nodes = {'a1': {'port': 6001, 'role': 'primary'}}
+        self.coordinator.conn_pool[('localhost', 6001)] = queue.LifoQueue()
+
+        stale = MagicMock()
+        stale.sendall.side_effect = BrokenPipeError()
+        fresh = MagicMock()
+        reply = bytearray(encode_msg({'status': 'success', 'balance': 5}))
+        def fake_recv_into(view):
+            chunk = reply[:len(view)]
+            view[:len(chunk)] = chunk
+            del reply[:len(chunk)]
+            return len(chunk)
+        fresh.recv_into.side_effect = fake_recv_into
+        self.coordinator.checkout_connection = MagicMock(side_effect=[(stale, True), (fresh, False)])
+
+        response = self.coordinator.rpc('a1', {'command': 'get_balance'})
+
+        self.assertEqual(response['balance'], 5)
+        stale.close.assert_called_once()
+        fresh.close.assert_not_called()
+        self.assertIs(self.coordinator.conn_pool[('localhost', 6001)].get_nowait(), fresh)
+
+    def test_rpc_does_not_resend_non_idempotent_request(self):
+        """测试请求已发出后连接断开时，非幂等的 execute_transfer 不会被重发"""
+        self.coordinator.account_nodes = {'a1': {'port': 6001, 'role': 'primary'}}
+        stale = MagicMock()
+        stale.recv_into.side_effect = ConnectionResetError()
+        fresh = MagicMock()
+        self.coordinator.checkout_connection = MagicMock(side_effect=[(stale, True), (fresh, False)])
+
+        with self.assertRaises(ConnectionResetError):
+            self.coordinator.rpc('a1', {'command': 'execute_transfer', 'transaction_id': 'tx1', 'amount': 10})
+
+        stale.sendall.assert_called_once()
+        fresh.sendall.assert_not_called()
+        self.assertEqual(self.coordinator.checkout_connection.call_count, 1)
+
+    def test_shutdown_stops_accept_loop_and_closes_cancelled_clients(self):
+        """测试 shutdown 先停止接收连接，被取消的排队请求会关闭客户端连接"""
+        self.coordinator.port = 0 # 绑定任意空闲端口
+        server_thread = threading.Thread(target=self.coordinator.start_server, daemon=True)
+        server_thread.start()
+        for _ in range(100):
+            if self.coordinator.server_socket is not None:
+                break
+            time.sleep(0.01)
+
+        self.coordinator.shutdown()
+        server_thread.join(timeout=2)
+        self.assertFalse(server_thread.is_alive())
+
+        cancelled = Future()
+        cancelled.cancel()
+        client = MagicMock()
+        self.coordinator.request_slots.acquire()
+        self.coordinator.release_request_slot(cancelled, client)
+        client.close.assert_called_once()
+
+    def test_two_phase_commit_prepares_in_parallel(self):
+        """测试 2PC 并行准备双方，任一方未就绪时中止且不进入执行阶段"""
+        both_in_flight = threading.Barrier(2, timeout=2)
+        def prepare(account_id, amount, is_sender):
+            both_in_flight.wait() # 串行执行时第一个 prepare 会在这里超时
+            return account_id == 'a1'
+        self.coordinator.prepare_transfer = MagicMock(side_effect=prepare)
+        self.coordinator.execute_transfer = MagicMock(return_value=True)
+        self.coordinator.wal = None # 无日志文件时只请求后台线程写快照
+        self.coordinator.save_data = MagicMock() # 不写真实的数据文件
+
+        result = TransactionCoordinator.execute_two_phase_commit(self.coordinator, 'tx1', 'a1', 'a2', 100)
+
+        self.assertFalse(result)
+        self.assertFalse(both_in_flight.broken)
+        self.assertEqual(self.coordinator.prepare_transfer.call_count, 2)
+        self.coordinator.execute_transfer.assert_not_called()
+        self.assertEqual(self.coordinator.transactions['tx1']['status'], 'aborted')
+
+    def test_two_phase_commit_does_not_wait_for_node_lock(self):
+        """测试 2PC 的事务记录只使用事务锁，节点锁被占用时仍能完成"""
+        self.coordinator.prepare_transfer = MagicMock(return_value=True)
+        self.coordinator.execute_transfer = MagicMock(return_value=True)
+        self.coordinator.wal_size = 0
+        holding, release = threading.Event(), threading.Event()
+        def hold_node_lock():
+            with self.coordinator.lock:
+                holding.set()
+                release.wait(2)
+        holder = threading.Thread(target=hold_node_lock)
+        holder.start()
+        holding.wait(2)
+        try:
+            result = TransactionCoordinator.execute_two_phase_commit(self.coordinator, 'tx1', 'a1', 'a2', 100)
+        finally:
+            release.set()
+            holder.join()
+
+        self.assertTrue(result)
+        self.assertEqual(self.coordinator.transactions['tx1']['status'], 'completed')
+
+    def test_status_queries_do_not_wait_for_node_lock(self):
+        """测试 list_accounts 和 check_node_status 不需要节点锁，并返回节点记录的副本"""
+        self.coordinator.account_nodes = {'a1': {'port': 6001, 'role': 'primary', 'last_heartbeat': 1000.0}}
+        self.coordinator.node_pairs = {'a1': 'a1b'}
+        holding, release = threading.Event(), threading.Event()
+        def hold_node_lock():
+            with self.coordinator.lock:
+                holding.set()
+                release.wait(2)
+        holder = threading.Thread(target=hold_node_lock)
+        holder.start()
+        holding.wait(2)
+        try:
+            accounts = self.coordinator.handle_list_accounts({'command': 'list_accounts'}, None)
+            status = self.coordinator.handle_check_node_status({'command': 'check_node_status', 'node_id': 'a1'}, None)
+        finally:
+            release.set()
+            holder.join()
+
+        self.assertEqual(accounts['accounts'], ['a1'])
+        self.assertTrue(status['is_active'])
+        self.assertEqual(status['backup_node'], 'a1b')
+        self.assertIsNot(status['node_info'], self.coordinator.account_nodes['a1'])
+
+    def test_failover_commands_release_node_lock_during_rpc(self):
+        """测试 simulate_failure 和 recover_node 调用节点 RPC 时不持有节点锁，状态仍正确更新"""
+        self.coordinator.wal_size = 0
+        self.coordinator.account_nodes = {'a1': {'port': 6001, 'role': 'primary'}, 'a1b': {'port': 6002, 'role': 'backup'}}
+        with self.coordinator.lock:
+            self.coordinator.pair_nodes('a1', 'a1b')
+        lock_free_during_rpc = []
+        def probe_lock():
+            acquired = self.coordinator.lock.acquire(timeout=1)
+            if acquired:
+                self.coordinator.lock.release()
+            lock_free_during_rpc.append(acquired)
+        def fake_rpc(node_id, request, timeout=None):
+            # 另一个线程能拿到锁，说明发起 RPC 的线程没有持有它
+            probe = threading.Thread(target=probe_lock)
+            probe.start()
+            probe.join()
+            return {'status': 'success', 'balance': 42}
+        self.coordinator.rpc = MagicMock(side_effect=fake_rpc)
+
+        response = self.coordinator.handle_simulate_failure({'command': 'simulate_failure', 'node_id': 'a1'}, None)
+        self.assertTrue(response['backup_promoted'])
+        self.assertEqual(self.coordinator.account_nodes['a1b']['role'], 'primary')
+
+        response = self.coordinator.handle_recover_node({'command': 'recover_node', 'node_id': 'a1'}, None)
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual([call.args[1]['command'] for call in self.coordinator.rpc.call_args_list],
+                         ['become_primary', 'get_balance', 'force_set_balance', 'become_backup'])
+        self.assertEqual(lock_free_during_rpc, [True] * 4)
+        self.assertNotIn('status', self.coordinator.account_nodes['a1'])
+        self.assertEqual(self.coordinator.account_nodes['a1b']['role'], 'backup')
+        self.assertEqual(self.coordinator.node_pairs, {'a1': 'a1b'})
+
+    def test_promotion_does_not_wait_for_backup_reply(self):
+        """测试提升备份节点时不等待 become_primary 的回复，恢复流程会先等这条通知发完"""
+        self.coordinator.wal_size = 0
+        self.coordinator.account_nodes = {'a1': {'port': 6001, 'role': 'primary', 'status': 'failed'},
+                                          'a1b': {'port': 6002, 'role': 'backup'}}
+        with self.coordinator.lock:
+            self.coordinator.pair_nodes('a1', 'a1b')
+        reply_sent = threading.Event()
+        def slow_rpc(node_id, request, timeout=None):
+            if request['command'] == 'become_primary':
+                reply_sent.wait(2)
+            return {'status': 'success', 'balance': 42}
+        self.coordinator.rpc = MagicMock(side_effect=slow_rpc)
+
+        # setUp 把实例上的 promote_backup_to_primary 换成了 mock，这里调用真实实现
+        self.assertTrue(TransactionCoordinator.promote_backup_to_primary(self.coordinator, 'a1b', 'a1'))
+        self.assertEqual(self.coordinator.account_nodes['a1b']['role'], 'primary')
+        notice = self.coordinator.promotion_notices['a1b']
+        self.assertFalse(notice.done())
+
+        reply_sent.set()
+        response = self.coordinator.handle_recover_node({'command': 'recover_node', 'node_id': 'a1'}, None)
+        self.assertEqual(response['status'], 'success')
+        self.assertTrue(notice.result())
+        self.assertEqual([call.args[1]['command'] for call in self.coordinator.rpc.call_args_list],
+                         ['become_primary', 'get_balance', 'force_set_balance', 'become_backup'])
+
+        # 节点没有恢复时，通知发送完成后也会从登记表中移除
+        self.coordinator.account_nodes['a2b'] = {'port': 6004, 'role': 'backup'}
+        self.coordinator.send_promotion_notice('a2b')
+        self.coordinator.rpc_pool.shutdown(wait=True)
+        self.assertEqual(self.coordinator.promotion_notices, {})
+
+    def test_get_balance_redirects_failed_account_to_takeover_node(self):
+        """测试失败账户的余额查询转发到已提升为主节点的备份，没有接管节点时返回错误"""
+        self.coordinator.account_nodes = {'a1': {'port': 6001, 'role': 'primary', 'status': 'failed'},
+                                          'a1b': {'port': 6002, 'role': 'primary'},
+                                          'a2': {'port': 6003, 'role': 'primary', 'status': 'failed'}}
+        self.coordinator.rpc = MagicMock(return_value={'status': 'success', 'balance': 7})
+
+        response = self.coordinator.handle_get_balance({'command': 'get_balance', 'account_id': 'a1'}, None)
+        self.assertEqual(response, {'status': 'success', 'balance': 7, 'account_id': 'a1b', 'used_backup': True})
+        self.assertEqual(self.coordinator.rpc.call_args.args[0], 'a1b')
+
+        response = self.coordinator.handle_get_balance({'command': 'get_balance', 'account_id': 'a2'}, None)
+        self.assertEqual(response['status'], 'error')
+        self.assertIsNone(self.coordinator.takeover_node('a2'))
 
 if __name__ == '__main__':
     unittest.main(argv=['first-arg-is-ignored'], exit=False) 
\ No newline at end of file